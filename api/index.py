@@ -1,14 +1,64 @@
 """
 Vercel deployment for Route Optimizer - Full functionality matching local version
 """
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, request, jsonify, Response
 import pandas as pd
+import numpy as np
 import os
 import logging
 import math
 import requests
 import time
 import json
+import tempfile
+import csv
+import gc
+import gzip
+import sqlite3
+import threading
+from io import StringIO, BytesIO
+import re
+from functools import partial, lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+# Numba writes its JIT cache next to the source by default, which is read-only on Vercel
+os.environ.setdefault('NUMBA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'numba_cache'))
+
+# Numba is optional - without it the 2-opt kernel runs as plain Python
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """No-op stand-in for numba.njit when numba is not installed"""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# OR-Tools is optional - larger routes are seeded with its guided local search when present
+try:
+    from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+    ORTOOLS_AVAILABLE = True
+except ImportError:
+    ORTOOLS_AVAILABLE = False
+
+# PyArrow is optional - when present uploads are parsed with Arrow's multithreaded CSV reader
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# orjson is optional - when present the route response is serialized in native code
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 # Configure logging for Vercel
 logging.basicConfig(level=logging.INFO)
@@ -20,12 +70,35 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
 # Get API key from environment
 OPENROUTESERVICE_API_KEY = os.environ.get('OPENROUTESERVICE_API_KEY', None)
-logger.info(f"Flask app startup: API key = {'*' * (len(OPENROUTESERVICE_API_KEY) - 8) + OPENROUTESERVICE_API_KEY[-8:] if OPENROUTESERVICE_API_KEY else 'None'}")
-logger.info(f"API key length: {len(OPENROUTESERVICE_API_KEY) if OPENROUTESERVICE_API_KEY else 0} characters")
+_HAS_API = bool(OPENROUTESERVICE_API_KEY)
+_MASKED_KEY = ('*' * (len(OPENROUTESERVICE_API_KEY) - 8) + OPENROUTESERVICE_API_KEY[-8:]) if _HAS_API else 'None'
+logger.info("Flask app startup: API key = %s", _MASKED_KEY)
+logger.info("API key length: %d characters", len(OPENROUTESERVICE_API_KEY) if _HAS_API else 0)
+
+# Shared HTTP session so geocoding requests reuse pooled connections
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(pool_connections=16, pool_maxsize=16))
+
+# Concurrent geocoding requests for addresses missing from the cache
+GEOCODING_WORKERS = 8
 
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'csv'}
 
+# CSV separators and encodings accepted for uploads, in order of preference
+CSV_SEPARATORS = [',', ';', '\t']
+CSV_ENCODINGS = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
+
+# Candidate neighbors per stop considered by 2-opt
+TWO_OPT_NEIGHBORS = 20
+
+# Independent 2-opt runs from different seed tours, the shortest result wins
+TWO_OPT_RESTARTS = 4
+
+# Routes above this many stops are solved with OR-Tools (when installed) before 2-opt
+ORTOOLS_MIN_STOPS = 25
+ORTOOLS_TIME_LIMIT = 1  # seconds
+
 # Embedded cache data for Vercel (from your local cache)
 GEOCODING_CACHE = {
     "Hauptstr. 40, 85643, Steinhöring, Germany": (48.0828668, 12.0630946),
@@ -46,12 +119,160 @@ GEOCODING_CACHE = {
     "Schleissheimer Str. 4, 85748, Garching, Germany": (48.2494586, 11.6513853)
 }
 
+# Structure-of-arrays view of the cache: address -> row index into contiguous coordinate arrays
+_CACHE_IDX = {address: i for i, address in enumerate(GEOCODING_CACHE)}
+_CACHE_LAT = np.fromiter((coords[0] for coords in GEOCODING_CACHE.values()), dtype=np.float64, count=len(GEOCODING_CACHE))
+_CACHE_LNG = np.fromiter((coords[1] for coords in GEOCODING_CACHE.values()), dtype=np.float64, count=len(GEOCODING_CACHE))
+
+# Addresses geocoded through the API are persisted in /tmp, which is writable on Vercel
+# and survives for as long as the function instance stays warm
+GEOCODE_DB_PATH = os.path.join(tempfile.gettempdir(), 'geocode.db')
+_GEOCODE_DB_LOCK = threading.Lock()
+
+def normalize_address_key(street, postcode, city):
+    """Persistent cache key - lowercase with runs of whitespace collapsed"""
+    return re.sub(r'\s+', ' ', f"{street}|{postcode}|{city}".lower().strip())
+
+# Upper bound on persisted results held in memory; the database itself keeps all of them
+GEOCODE_LRU_SIZE = 50_000
+
+def _open_geocode_db():
+    """Open the persistent geocoding cache, in memory if /tmp is not usable"""
+    try:
+        # One private connection behind _GEOCODE_DB_LOCK (never cache=shared); WAL lets other
+        # instances sharing /tmp read while this one writes
+        conn = sqlite3.connect(GEOCODE_DB_PATH, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, lat REAL, lng REAL, ts INTEGER)")
+        return conn
+    except sqlite3.Error as e:
+        logger.warning("Persistent geocoding cache unavailable, keeping results in memory: %s", e)
+        conn = sqlite3.connect(':memory:', check_same_thread=False)
+        conn.execute("CREATE TABLE cache (key TEXT PRIMARY KEY, lat REAL, lng REAL, ts INTEGER)")
+        return conn
+
+_GEOCODE_DB = _open_geocode_db()
+
+@lru_cache(maxsize=GEOCODE_LRU_SIZE)
+def _persisted_coords(key):
+    """Stored (lat, lng) for a normalized key; raises KeyError when absent so misses are not cached"""
+    with _GEOCODE_DB_LOCK:
+        row = _GEOCODE_DB.execute("SELECT lat, lng FROM cache WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        raise KeyError(key)
+    return row
+
+def lookup_geocoded(key):
+    """Previously geocoded (lat, lng) for a normalized key, or None"""
+    try:
+        return _persisted_coords(key)
+    except KeyError:
+        return None
+    except sqlite3.Error as e:
+        logger.warning("Persistent geocoding lookup failed for %s: %s", key, e)
+        return None
+
+def store_geocoded(key, coords):
+    """Persist an API geocoding result"""
+    try:
+        with _GEOCODE_DB_LOCK:
+            _GEOCODE_DB.execute("INSERT OR REPLACE INTO cache (key, lat, lng, ts) VALUES (?, ?, ?, ?)",
+                                (key, coords[0], coords[1], int(time.time())))
+            _GEOCODE_DB.commit()
+    except sqlite3.Error as e:
+        logger.warning("Could not persist geocoding result for %s: %s", key, e)
+
+def decode_csv_bytes(raw):
+    """Decode uploaded CSV bytes with the first encoding that accepts them"""
+    for encoding in CSV_ENCODINGS:
+        try:
+            return raw.decode(encoding), encoding
+        except UnicodeDecodeError:
+            continue
+    return None, None
+
+def _read_csv_arrow(text, separator):
+    """Parse CSV text with pyarrow, every column as an Arrow-backed string"""
+    header = next(csv.reader(StringIO(text), delimiter=separator), [])
+    if len(set(header)) != len(header):
+        raise ValueError("duplicate column names")
+    
+    table = pa_csv.read_csv(
+        BytesIO(text.encode('utf-8')),
+        parse_options=pa_csv.ParseOptions(delimiter=separator),
+        convert_options=pa_csv.ConvertOptions(column_types={name: pa.string() for name in header},
+                                              strings_can_be_null=True)
+    )
+    return table.to_pandas(types_mapper={pa.string(): pd.StringDtype('pyarrow')}.get)
+
+def parse_csv_text(text, separator):
+    """Parse CSV text with every field as a string so postal codes keep their leading zeros"""
+    if PYARROW_AVAILABLE:
+        try:
+            return _read_csv_arrow(text, separator)
+        except Exception:
+            # Ragged rows and duplicate headers are left to pandas, which tolerates them
+            pass
+    return pd.read_csv(StringIO(text), sep=separator, engine='c', dtype='string')
+
+def read_csv_upload(raw):
+    """Parse uploaded CSV bytes, returns (DataFrame, config description) or (None, None)"""
+    text, encoding = decode_csv_bytes(raw)
+    if text is None:
+        return None, None
+    
+    # Try the sniffed separator first and the remaining ones only if it does not parse
+    separators_to_try = list(CSV_SEPARATORS)
+    try:
+        dialect = csv.Sniffer().sniff(text[:65536], delimiters=''.join(CSV_SEPARATORS))
+        separators_to_try.remove(dialect.delimiter)
+        separators_to_try.insert(0, dialect.delimiter)
+    except csv.Error:
+        pass
+    
+    for separator in separators_to_try:
+        try:
+            temp_df = parse_csv_text(text, separator)
+        except Exception:
+            continue
+        
+        if len(temp_df.columns) > 1 and len(temp_df) > 0:
+            successful_config = f"separator='{separator}', encoding='{encoding}'"
+            logger.info("Successfully read CSV with %s", successful_config)
+            return temp_df, successful_config
+    
+    return None, None
+
+def clean_text_column(df, column):
+    """Return a column as stripped strings with missing values as '' (all '' if the column is not mapped)"""
+    if not column:
+        return pd.Series('', index=df.index, dtype='string')
+    return df[column].astype('string').str.strip().fillna('')
+
+def route_codes(route_values):
+    """Codes of each row's route in sorted route order, -1 where the route is missing"""
+    # Every field is parsed as a string; route ids that are all numbers still sort numerically (9 before 10)
+    numeric = pd.to_numeric(route_values, errors='coerce')
+    if numeric.notna().sum() == route_values.notna().sum():
+        route_values = numeric
+    return pd.factorize(route_values, sort=True)[0]
+
+# Customer column: mentions "name" but not "shipment" (e.g. "Shipment Name" is not a customer)
+CUSTOMER_COLUMN_RE = re.compile(r'(?!.*shipment)(?=.*name)', re.IGNORECASE | re.DOTALL)
+
+@lru_cache(maxsize=64)
+def find_customer_col(columns):
+    """First customer name column in a tuple of column names, cached per CSV layout"""
+    return next(filter(CUSTOMER_COLUMN_RE.match, columns), None)
+
+@lru_cache(maxsize=256)
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def haversine_distance(lat1, lon1, lat2, lon2):
-    """Calculate haversine distance between two points"""
+    """Calculate haversine distance between two points (scalar fast path, use haversine_matrix for bulk)"""
     R = 6371  # Earth's radius in kilometers
     dlat = math.radians(lat2 - lat1)
     dlon = math.radians(lon2 - lon1)
@@ -59,17 +280,55 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     c = 2 * math.asin(math.sqrt(a))
     return R * c
 
-def geocode_address(street, postcode, city, country="Germany"):
-    """Geocode address using cache first, then API if needed"""
+def haversine_matrix(lats, lngs):
+    """Calculate the full pairwise haversine distance matrix (vectorized counterpart of haversine_distance)
+    
+    Computed in float32: metre-level error is far below the km rounding used for reporting,
+    and the matrix takes half the memory bandwidth in the 2-opt scan.
+    """
+    lat_r = np.radians(np.asarray(lats, dtype=np.float32))
+    lng_r = np.radians(np.asarray(lngs, dtype=np.float32))
+    
+    # cos(lat) is computed once per stop, the n x n trig work is left to the two half-angle sines.
+    # Everything after the two differences is done in place, so peak memory is two n x n buffers.
+    cos_lat = np.cos(lat_r)
+    a = lat_r[:, None] - lat_r[None, :]
+    a *= np.float32(0.5)
+    np.sin(a, out=a)
+    np.square(a, out=a)
+    dlng = lng_r[:, None] - lng_r[None, :]
+    dlng *= np.float32(0.5)
+    np.sin(dlng, out=dlng)
+    np.square(dlng, out=dlng)
+    dlng *= cos_lat[:, None]
+    dlng *= cos_lat[None, :]
+    a += dlng
+    del dlng
+    np.sqrt(a, out=a)
+    np.arcsin(a, out=a)
+    a *= np.float32(6371.0 * 2)
+    return a
+
+def geocode_address(street, postcode, city, country="Germany", session=None):
+    """Geocode address using cache first, then API if needed (optionally over a shared session),
+    returns (coords or None, whether the coords came from a cache)"""
     address_key = f"{street}, {postcode}, {city}, {country}"
     
     # Check cache first
-    if address_key in GEOCODING_CACHE:
-        logger.info(f"Cache hit: {address_key}... -> {GEOCODING_CACHE[address_key]}")
-        return GEOCODING_CACHE[address_key]
+    idx = _CACHE_IDX.get(address_key)
+    if idx is not None:
+        coords = (_CACHE_LAT[idx], _CACHE_LNG[idx])
+        logger.info("Cache hit: %s... -> %s", address_key, coords)
+        return coords, True
+    
+    normalized_key = normalize_address_key(street, postcode, city)
+    coords = lookup_geocoded(normalized_key)
+    if coords is not None:
+        logger.info("Persistent cache hit: %s... -> %s", address_key, coords)
+        return coords, True
     
     # If not in cache and we have API key, try to geocode
-    if OPENROUTESERVICE_API_KEY:
+    if _HAS_API:
         try:
             url = "https://api.openrouteservice.org/geocode/search"
             params = {
@@ -79,86 +338,259 @@ def geocode_address(street, postcode, city, country="Germany"):
                 'size': 1
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            response = (session or requests).get(url, params=params, timeout=10)
             if response.status_code == 200:
                 data = response.json()
                 if data['features']:
                     coords = data['features'][0]['geometry']['coordinates']
                     lat, lng = coords[1], coords[0]
-                    logger.info(f"Geocoded: {address_key} -> ({lat}, {lng})")
-                    return (lat, lng)
+                    logger.info("Geocoded: %s -> (%s, %s)", address_key, lat, lng)
+                    store_geocoded(normalized_key, (lat, lng))
+                    return (lat, lng), False
         except Exception as e:
-            logger.warning(f"Geocoding failed for {address_key}: {str(e)}")
+            logger.warning("Geocoding failed for %s: %s", address_key, e)
     
     # Return None if geocoding fails
-    logger.warning(f"Could not geocode: {address_key}")
-    return None
+    logger.warning("Could not geocode: %s", address_key)
+    return None, False
 
-def optimize_route_2opt(stops_with_coords):
-    """Optimize route using 2-opt algorithm"""
-    n = len(stops_with_coords)
-    if n < 3:
-        return stops_with_coords, 0.0, 0.0
-    
-    # Create distance matrix
-    distances = {}
-    for i in range(n):
-        for j in range(n):
-            if i != j:
-                lat1, lng1 = stops_with_coords[i]['coordinates']['lat'], stops_with_coords[i]['coordinates']['lng']
-                lat2, lng2 = stops_with_coords[j]['coordinates']['lat'], stops_with_coords[j]['coordinates']['lng']
-                distances[(i, j)] = haversine_distance(lat1, lng1, lat2, lng2)
-    
-    # Calculate initial route distance
-    def calculate_route_distance(route_order):
-        total_distance = 0
-        for i in range(len(route_order)):
-            current = route_order[i]
-            next_stop = route_order[(i + 1) % len(route_order)]
-            total_distance += distances[(current, next_stop)]
-        return total_distance
-    
-    # Initial route (just the order we received)
-    current_route = list(range(n))
-    current_distance = calculate_route_distance(current_route)
-    original_distance = current_distance
+def _tour_distance(route, D):
+    """Length of the closed tour visiting D's stops in route order"""
+    return float(D[route, np.roll(route, -1)].sum(dtype=np.float64))
+
+@njit(cache=True, nogil=True)
+def _nearest_neighbor(D, start=0):
+    """Greedy nearest-neighbor tour starting from the given stop"""
+    n = D.shape[0]
+    visited = np.zeros(n, dtype=np.bool_)
+    route = np.empty(n, dtype=np.int64)
+    route[0] = start
+    visited[start] = True
     
-    # Prevent division by zero
-    if original_distance == 0:
-        return stops_with_coords, 0.0, 0.0
+    for k in range(1, n):
+        candidates = np.where(visited, np.inf, D[route[k - 1]])
+        route[k] = int(np.argmin(candidates))
+        visited[route[k]] = True
+    
+    return route
+
+def _neighbor_lists(D, k=TWO_OPT_NEIGHBORS):
+    """Indices of the k nearest other stops for every stop, closest first"""
+    n = D.shape[0]
+    masked = D.copy()
+    np.fill_diagonal(masked, np.inf)
+    return np.argsort(masked, axis=1, kind='stable')[:, :min(k, n - 1)].astype(np.int64)
+
+@njit(cache=True, fastmath=True, nogil=True)
+def _two_opt(route, D, cand, max_iter):
+    """2-opt on a closed tour using O(1) delta costs, returns (route, distance, iterations, moves)"""
+    n = route.shape[0]
+    distance = 0.0
+    pos = np.empty(n, dtype=np.int64)
+    for k in range(n):
+        distance += float(D[route[k], route[(k + 1) % n]])
+        pos[route[k]] = k
+    
+    # Passes that shave off less than this are treated as a plateau
+    tol = 1e-6 * distance
+    plateau_passes = 0
+    moves = 0
     
     improved = True
     iterations = 0
-    max_iterations = 50  # Allow more iterations for better optimization
-    
-    while improved and iterations < max_iterations:
+    while improved and iterations < max_iter:
         improved = False
         iterations += 1
+        last_distance = distance
         
         for i in range(1, n - 1):
-            for j in range(i + 1, n):
-                # Try reversing the segment between i and j
-                new_route = current_route[:]
-                new_route[i:j+1] = reversed(new_route[i:j+1])
-                
-                new_distance = calculate_route_distance(new_route)
+            for jj in range(cand.shape[1]):
+                # Reversing route[i..j] only replaces edges (a,b) and (c,d) with (a,c) and (b,d);
+                # c is drawn from a's neighbor list so the new edge (a,c) is always a short one
+                a = route[i - 1]
+                b = route[i]
+                c = cand[a, jj]
+                j = pos[c]
+                if j <= i:
+                    continue
+                d = route[(j + 1) % n]
+                # Accumulate in float64 so rounding in the float32 matrix cannot fake an improvement
+                delta = (float(D[a, c]) + float(D[b, d])) - (float(D[a, b]) + float(D[c, d]))
                 
-                if new_distance < current_distance:
-                    current_route = new_route
-                    current_distance = new_distance
+                if delta < -1e-10:
+                    lo = i
+                    hi = j
+                    while lo < hi:
+                        tmp = route[lo]
+                        route[lo] = route[hi]
+                        route[hi] = tmp
+                        pos[route[lo]] = lo
+                        pos[route[hi]] = hi
+                        lo += 1
+                        hi -= 1
+                    distance += delta
                     improved = True
+                    moves += 1
+        
+        # Stop after two consecutive passes with negligible gains instead of running to the cap
+        if distance >= last_distance - tol:
+            plateau_passes += 1
+            if plateau_passes >= 2:
+                break
+        else:
+            plateau_passes = 0
+    
+    return route, distance, iterations, moves
+
+def _two_opt_best(route, D, max_iter):
+    """Best-improvement 2-opt on a closed tour, scoring every move per pass with NumPy, returns (route, distance, iterations, moves)"""
+    n = route.shape[0]
+    route = route.copy()
+    D64 = D.astype(np.float64)
+    distance = _tour_distance(route, D)
+    # Only moves with 1 <= i < j <= n-1 are valid; route[0] stays fixed
+    upper = np.triu(np.ones((n - 1, n - 1), dtype=bool), k=1)
+    
+    iterations = 0
+    moves = 0
+    # Each pass applies a single move, so allow enough passes for a full first-improvement run
+    while iterations < max_iter * n:
+        iterations += 1
+        nxt = np.roll(route, -1)
+        a, b = route[:-1], route[1:]          # edge (a, b) entering position i
+        c, d = route[1:], nxt[1:]             # edge (c, d) leaving position j
+        delta = (D64[a[:, None], c[None, :]] + D64[b[:, None], d[None, :]]
+                 - D64[a, b][:, None] - D64[c, d][None, :])
+        delta[~upper] = 0.0
+        best = int(delta.argmin())
+        if delta.flat[best] >= -1e-10:
+            break
+        i, j = divmod(best, n - 1)
+        route[i + 1:j + 2] = route[i + 1:j + 2][::-1]
+        distance += float(delta.flat[best])
+        moves += 1
+    
+    return route, distance, iterations, moves
+
+def _solve_ortools(D):
+    """Closed tour from OR-Tools guided local search starting at stop 0, or None if no solution"""
+    n = D.shape[0]
+    # OR-Tools works on integer arc costs, so use whole metres
+    cost = np.rint(D * 1000.0).astype(np.int64).tolist()
+    
+    manager = pywrapcp.RoutingIndexManager(n, 1, 0)
+    routing = pywrapcp.RoutingModel(manager)
+    
+    def arc_cost(from_index, to_index):
+        return cost[manager.IndexToNode(from_index)][manager.IndexToNode(to_index)]
+    
+    routing.SetArcCostEvaluatorOfAllVehicles(routing.RegisterTransitCallback(arc_cost))
+    
+    params = pywrapcp.DefaultRoutingSearchParameters()
+    params.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
+    params.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
+    params.time_limit.seconds = ORTOOLS_TIME_LIMIT
+    
+    solution = routing.SolveWithParameters(params)
+    if solution is None:
+        return None
+    
+    route = []
+    index = routing.Start(0)
+    while not routing.IsEnd(index):
+        route.append(manager.IndexToNode(index))
+        index = solution.Value(routing.NextVar(index))
+    return np.array(route, dtype=np.int64)
+
+def optimize_route_order(lats, lngs, D=None):
+    """Optimize the visiting order of stops given as coordinate arrays using 2-opt,
+    returns (route as index array, distance saved, total distance)"""
+    n = len(lats)
+    original_route = np.arange(n, dtype=np.int64)
+    if n < 3:
+        return original_route, 0.0, 0.0
+    
+    # Create distance matrix in one vectorized haversine pass
+    if D is None:
+        D = haversine_matrix(lats, lngs)
+    
+    # Original route (just the order we received)
+    original_distance = _tour_distance(original_route, D)
+    
+    # Prevent division by zero
+    if original_distance == 0:
+        return original_route, 0.0, 0.0
+    
+    # Seed 2-opt with an OR-Tools tour for larger routes, otherwise a nearest-neighbor tour,
+    # keeping the received order if it is already better
+    initial_route = None
+    if ORTOOLS_AVAILABLE and n > ORTOOLS_MIN_STOPS:
+        try:
+            initial_route = _solve_ortools(D)
+        except Exception as e:
+            logger.warning("OR-Tools solve failed, falling back to nearest neighbor: %s", e)
+    if initial_route is None:
+        initial_route = _nearest_neighbor(D)
+    if _tour_distance(initial_route, D) > original_distance:
+        initial_route = original_route
+    
+    max_iterations = 50  # Allow more iterations for better optimization
+    if NUMBA_AVAILABLE:
+        # Restart from nearest-neighbor tours grown from other stops; the compiled kernel
+        # releases the GIL, so the runs proceed in parallel threads
+        cand = _neighbor_lists(D)
+        other_starts = np.random.default_rng(0).permutation(np.arange(1, n))[:TWO_OPT_RESTARTS - 1]
+        
+        def restart(start):
+            # The seed tours are built inside the workers, the compiled NN construction also runs without the GIL
+            seed = initial_route.copy() if start is None else _nearest_neighbor(D, start)
+            return _two_opt(seed, D, cand, max_iterations)
+        
+        starts = [None] + [int(start) for start in other_starts]
+        with ThreadPoolExecutor(max_workers=min(len(starts), os.cpu_count() or 1)) as executor:
+            results = list(executor.map(restart, starts))
+        current_route, current_distance, iterations, moves = min(results, key=lambda result: result[1])
+        # Tours are closed, so rotate the winner back to starting at the first stop
+        current_route = np.roll(current_route, -int(np.flatnonzero(current_route == 0)[0]))
+    else:
+        # Without the JIT the per-move loop runs in the interpreter, so score whole passes in NumPy instead
+        current_route, current_distance, iterations, moves = _two_opt_best(initial_route, D, max_iterations)
     
-    # Reorder stops according to optimized route
-    optimized_stops = [stops_with_coords[i] for i in current_route]
     distance_saved = original_distance - current_distance
     
-    logger.info(f"2-Opt completed after {iterations} iterations, improved: {distance_saved > 0}")
+    logger.info("2-Opt completed after %d iterations (%d moves), improved: %s", iterations, moves, distance_saved > 0)
     
     # Safe percentage calculation
     improvement_pct = (distance_saved/original_distance)*100 if original_distance > 0 else 0
-    logger.info(f"Route optimization: {n} stops, {distance_saved:.2f}km saved ({improvement_pct:.1f}%)")
+    logger.info("Route optimization: %d stops, %.2fkm saved (%.1f%%)", n, distance_saved, improvement_pct)
     
-    return optimized_stops, distance_saved, current_distance
+    return current_route, distance_saved, current_distance
+
+def optimize_route_2opt(stops_with_coords, D=None):
+    """Optimize route using 2-opt algorithm, over a precomputed distance matrix D if given"""
+    n = len(stops_with_coords)
+    # Only the distance matrix reads these, and it is computed in float32
+    lats = np.fromiter((s['coordinates']['lat'] for s in stops_with_coords), dtype=np.float32, count=n)
+    lngs = np.fromiter((s['coordinates']['lng'] for s in stops_with_coords), dtype=np.float32, count=n)
+    route, distance_saved, total_distance = optimize_route_order(lats, lngs, D)
+    
+    # Reorder stops according to optimized route
+    return [stops_with_coords[i] for i in route], distance_saved, total_distance
+
+# Define required column patterns and their variations, in order of preference
+REQUIRED_COLUMN_PATTERNS = {
+    'route': ['route', 'tour', 'trip', 'planned_trip', 'planned trip', 'vehicle', 'driver'],
+    'customer': ['name', 'customer', 'consignee', 'company'],
+    'street': ['street', 'address', 'addr', 'strasse', 'straße'],
+    'postal_code': ['postal', 'post', 'zip', 'plz', 'postcode', 'post code'],
+    'city': ['city', 'ort', 'town', 'place'],
+    'tracking': ['tracking', 'shipment', 'number', 'id']
+}
+
+# Precompiled matchers: a column matches when it contains one of the patterns. A column name that is
+# only part of a pattern does not count, short headers like 'a' or 'o' would match everything
+_PATTERN_RE = {req_type: re.compile('|'.join(map(re.escape, patterns)))
+               for req_type, patterns in REQUIRED_COLUMN_PATTERNS.items()}
 
 def validate_route_data(df):
     """Validate that the DataFrame contains required columns for route optimization"""
@@ -171,27 +603,21 @@ def validate_route_data(df):
         'warnings': []
     }
     
-    # Define required column patterns and their variations
-    required_patterns = {
-        'route': ['route', 'tour', 'trip', 'planned_trip', 'planned trip', 'vehicle', 'driver'],
-        'customer': ['name', 'customer', 'consignee', 'company'],
-        'street': ['street', 'address', 'addr', 'strasse', 'straße'],
-        'postal_code': ['postal', 'post', 'zip', 'plz', 'postcode', 'post code'],
-        'city': ['city', 'ort', 'town', 'place'],
-        'tracking': ['tracking', 'shipment', 'number', 'id']
-    }
-    
     # Get actual column names (case-insensitive)
     actual_columns = [col.lower().strip() for col in df.columns]
-    column_mapping = {col.lower().strip(): col for col in df.columns}
+    column_mapping = dict(zip(actual_columns, df.columns))
     
     # Find matching columns
     found_columns = {}
-    for req_type, patterns in required_patterns.items():
+    for req_type, patterns in REQUIRED_COLUMN_PATTERNS.items():
+        # One regex pass narrows the columns down, pattern priority is then resolved on the few candidates
+        pattern_re = _PATTERN_RE[req_type]
+        candidates = [col for col in actual_columns if pattern_re.search(col)]
+        
         found_column = None
         for pattern in patterns:
-            for actual_col in actual_columns:
-                if pattern in actual_col or actual_col in pattern:
+            for actual_col in candidates:
+                if pattern in actual_col:
                     found_column = column_mapping[actual_col]
                     break
             if found_column:
@@ -710,10 +1136,34 @@ MAIN_TEMPLATE = """
 </html>
 """
 
+def json_response(payload, status=200):
+    """JSON response via orjson when installed (keys sorted like jsonify), jsonify otherwise"""
+    if ORJSON_AVAILABLE:
+        try:
+            body = orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_SORT_KEYS)
+            return app.response_class(body, status=status, mimetype='application/json')
+        except TypeError:
+            # orjson.JSONEncodeError is a TypeError - leave unusual payloads to Flask's encoder
+            pass
+    return jsonify(payload), status
+
+# The page has no template variables, so it is encoded and compressed once
+_INDEX_HTML = MAIN_TEMPLATE.encode('utf-8')
+_INDEX_GZ = gzip.compress(_INDEX_HTML, 9)
+
 @app.route('/')
 def index():
     """Main page with full web interface"""
-    return render_template_string(MAIN_TEMPLATE)
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        return Response(_INDEX_GZ, headers={
+            'Content-Encoding': 'gzip',
+            'Content-Type': 'text/html; charset=utf-8',
+            'Vary': 'Accept-Encoding'
+        })
+    return Response(_INDEX_HTML, headers={
+        'Content-Type': 'text/html; charset=utf-8',
+        'Vary': 'Accept-Encoding'
+    })
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -733,40 +1183,17 @@ def upload_file():
         if not allowed_file(file.filename):
             return jsonify({'error': 'Only CSV files are allowed'}), 400
         
-        # Read CSV directly from memory - try different separators and encodings
-        separators_to_try = [',', ';', '\t']
-        encodings_to_try = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-        
-        df = None
-        successful_config = None
-        
-        for separator in separators_to_try:
-            for encoding in encodings_to_try:
-                try:
-                    file.seek(0)
-                    content = file.read().decode(encoding)
-                    from io import StringIO
-                    csv_data = StringIO(content)
-                    temp_df = pd.read_csv(csv_data, sep=separator)
-                    
-                    if len(temp_df.columns) > 1 and len(temp_df) > 0:
-                        df = temp_df
-                        successful_config = f"separator='{separator}', encoding='{encoding}'"
-                        logger.info(f"Successfully read CSV with {successful_config}")
-                        break
-                except Exception as e:
-                    continue
-            if df is not None:
-                break
+        # Read CSV directly from memory - decode once, then parse with the sniffed separator
+        df, successful_config = read_csv_upload(file.read())
         
         if df is None:
             raise Exception("Could not parse CSV file with any combination of separators and encodings")
         
         # Clean up the data
         df = df.dropna(how='all')
-        logger.info(f"Loaded CSV: {file.filename}")
-        logger.info(f"Shape after cleaning: {df.shape}")
-        logger.info(f"Columns: {list(df.columns)}")
+        logger.info("Loaded CSV: %s", file.filename)
+        logger.info("Shape after cleaning: %s", df.shape)
+        logger.info("Columns: %s", list(df.columns))
         
         # Validate the data
         validation = validate_route_data(df)
@@ -794,72 +1221,111 @@ def upload_file():
                 start_time = time.time()
                 
                 # Extract address information using validation results
-                stops_with_coords = []
-                geocoded_count = 0
-                cache_hits = 0
-                
                 address_columns = validation['address_columns']
                 route_column = validation['route_column']
                 
-                # Group by route if route column exists
-                routes = {}
+                # Get customer name column
+                customer_col = find_customer_col(tuple(df.columns))
+                
+                # Only the route, address and customer columns are needed from here on
+                used_columns = [route_column, *address_columns.values(), customer_col]
+                df = df[list(dict.fromkeys(col for col in used_columns if col))]
+                
+                # Process the main route (first route in sorted order, or all data).
+                # Only its rows are selected - the other routes are never materialized.
                 if route_column:
-                    route_groups = df.groupby(route_column)
-                    for route_id, route_df in route_groups:
-                        routes[route_id] = route_df
+                    main_route_data = df.iloc[np.flatnonzero(route_codes(df[route_column]) == 0)]
                 else:
                     # Treat all data as one route
-                    routes['Default Route'] = df
+                    main_route_data = df
                 
-                # Process the main route (first one or all data)
-                main_route_data = list(routes.values())[0]
+                # Drop rows missing any address part before doing any string work on them
+                address_parts = [address_columns.get(part) for part in ('street', 'postal_code', 'city')]
+                present = np.ones(len(main_route_data), dtype=bool)
+                for column in address_parts:
+                    present &= main_route_data[column].notna().to_numpy(dtype=bool) if column else False
+                address_rows = main_route_data.iloc[np.flatnonzero(present)]
                 
-                for index, row in main_route_data.iterrows():
-                    street = str(row[address_columns.get('street', '')]).strip() if address_columns.get('street') and pd.notna(row[address_columns.get('street', '')]) else None
-                    postcode = str(row[address_columns.get('postal_code', '')]).strip() if address_columns.get('postal_code') and pd.notna(row[address_columns.get('postal_code', '')]) else None
-                    city = str(row[address_columns.get('city', '')]).strip() if address_columns.get('city') and pd.notna(row[address_columns.get('city', '')]) else None
-                    
-                    # Get customer name
-                    customer_col = None
-                    for col in df.columns:
-                        if 'name' in col.lower() and 'shipment' not in col.lower():
-                            customer_col = col
-                            break
+                # Clean the address columns in bulk - stripped strings, missing values as ''
+                streets = clean_text_column(address_rows, address_columns.get('street'))
+                postcodes = clean_text_column(address_rows, address_columns.get('postal_code'))
+                cities = clean_text_column(address_rows, address_columns.get('city'))
+                customers = address_rows[customer_col].astype('string').str.strip() if customer_col else pd.Series(pd.NA, index=address_rows.index, dtype='string')
+                
+                # Resolve cached coordinates for every row at once, only misses go through the API path
+                address_keys = streets + ', ' + postcodes + ', ' + cities + ', Germany'
+                cache_rows = address_keys.map(_CACHE_IDX).to_numpy(dtype=np.float64, na_value=np.nan)
+                has_address = ((streets != '') & (postcodes != '') & (cities != '')).to_numpy(dtype=bool)
+                is_hit = has_address & ~np.isnan(cache_rows)
+                is_miss = has_address & np.isnan(cache_rows)
+                
+                lats = np.full(len(address_rows), np.nan)
+                lngs = np.full(len(address_rows), np.nan)
+                hit_rows = cache_rows[is_hit].astype(np.int64)
+                lats[is_hit] = _CACHE_LAT[hit_rows]
+                lngs[is_hit] = _CACHE_LNG[hit_rows]
+                cache_hits = int(is_hit.sum())
+                
+                # Each distinct missing address is resolved once: from the persistent cache if it was
+                # geocoded before, otherwise concurrently through the API over the pooled session
+                if is_miss.any():
+                    miss_positions = np.flatnonzero(is_miss)
+                    miss_keys = (streets.iloc[miss_positions] + '|' + postcodes.iloc[miss_positions] + '|'
+                                 + cities.iloc[miss_positions]).str.lower().str.strip().str.replace(r'\s+', ' ', regex=True)
+                    miss_codes, unique_keys = pd.factorize(miss_keys)
+                    first_positions = miss_positions[np.unique(miss_codes, return_index=True)[1]]
+                    unique_coords = [lookup_geocoded(key) for key in unique_keys]
+                    stored = np.array([coords is not None for coords in unique_coords], dtype=bool)
                     
-                    customer = str(row[customer_col]).strip() if customer_col and pd.notna(row[customer_col]) else f"Stop {len(stops_with_coords) + 1}"
+                    if not stored.all():
+                        lookup = first_positions[~stored]
+                        geocode = partial(geocode_address, session=_SESSION)
+                        with ThreadPoolExecutor(max_workers=GEOCODING_WORKERS) as executor:
+                            fetched = executor.map(geocode, streets.iloc[lookup].tolist(),
+                                                   postcodes.iloc[lookup].tolist(), cities.iloc[lookup].tolist())
+                            # The geocoder reports cache hits itself, e.g. an address stored by a concurrent upload
+                            for k, (coords, from_cache) in zip(np.flatnonzero(~stored), fetched):
+                                unique_coords[k] = coords
+                                stored[k] = from_cache
                     
-                    if street and postcode and city:
-                        coords = geocode_address(street, postcode, city)
-                        if coords:
-                            stops_with_coords.append({
-                                'stop_number': len(stops_with_coords) + 1,
-                                'customer': customer,
-                                'street': street,
-                                'postal_code': postcode,
-                                'city': city,
-                                'coordinates': {'lat': coords[0], 'lng': coords[1]}
-                            })
-                            geocoded_count += 1
-                            
-                            # Check if it was a cache hit
-                            address_key = f"{street}, {postcode}, {city}, Germany"
-                            if address_key in GEOCODING_CACHE:
-                                cache_hits += 1
+                    cache_hits += int(stored[miss_codes].sum())
+                    unique_lats = np.array([c[0] if c else np.nan for c in unique_coords])
+                    unique_lngs = np.array([c[1] if c else np.nan for c in unique_coords])
+                    lats[miss_positions] = unique_lats[miss_codes]
+                    lngs[miss_positions] = unique_lngs[miss_codes]
+                
+                # Keep the geocoded rows only: coordinates as dense arrays, display names and addresses alongside
+                found = ~np.isnan(lats)
+                stop_lats = lats[found]
+                stop_lngs = lngs[found]
+                stop_names = [customer if pd.notna(customer) else f"Stop {k}"
+                              for k, customer in enumerate(customers[found].tolist(), 1)]
+                stop_addresses = (streets[found] + ', ' + postcodes[found] + ' ' + cities[found]).tolist()
+                geocoded_count = len(stop_names)
+                total_addresses = len(main_route_data)
+                skipped_invalid = total_addresses - int(has_address.sum())
+                
+                # The frames and per-row text columns are dead from here on; free them before
+                # the optimizer allocates its n x n matrix
+                del df, main_route_data, address_rows, streets, postcodes, cities, customers, address_keys
+                gc.collect()
                 
                 # Update geocoding stats
                 cache_hit_rate = (cache_hits/geocoded_count*100) if geocoded_count > 0 else 0
                 stats['geocoding'] = {
-                    'total_addresses': len(main_route_data),
+                    'total_addresses': total_addresses,
+                    'skipped_invalid': skipped_invalid,
                     'geocoded_successfully': geocoded_count,
                     'cache_hits': cache_hits,
                     'cache_hit_rate': f"{cache_hit_rate:.1f}%"
                 }
                 
-                logger.info(f"Geocoded {geocoded_count}/{len(main_route_data)} stops ({cache_hits} cache hits, {cache_hit_rate:.1f}% hit rate)")
+                logger.info("Geocoded %d/%d stops (%d cache hits, %.1f%% hit rate)",
+                            geocoded_count, total_addresses, cache_hits, cache_hit_rate)
                 
-                if len(stops_with_coords) >= 2:
-                    # Perform route optimization
-                    optimized_stops, distance_saved, total_distance = optimize_route_2opt(stops_with_coords)
+                if geocoded_count >= 2:
+                    # Perform route optimization straight on the coordinate arrays
+                    route, distance_saved, total_distance = optimize_route_order(stop_lats, stop_lngs)
                     optimization_time = time.time() - start_time
                     
                     # Calculate improvement percentage
@@ -867,30 +1333,29 @@ def upload_file():
                     improvement_pct = (distance_saved/total_original_distance*100) if total_original_distance > 0 else 0
                     
                     # Prepare optimized route for response
-                    optimized_route = []
-                    for i, stop in enumerate(optimized_stops):
-                        optimized_route.append({
-                            'stop_number': i + 1,
-                            'name': stop['customer'],
-                            'address': f"{stop['street']}, {stop['postal_code']} {stop['city']}",
-                            'coordinates': {
-                                'latitude': stop['coordinates']['lat'],
-                                'longitude': stop['coordinates']['lng']
-                            }
-                        })
+                    optimized_route = [{
+                        'stop_number': i,
+                        'name': stop_names[k],
+                        'address': stop_addresses[k],
+                        'coordinates': {
+                            'latitude': lat,
+                            'longitude': lng
+                        }
+                    } for i, (k, lat, lng) in enumerate(zip(route.tolist(), stop_lats[route].tolist(),
+                                                           stop_lngs[route].tolist()), 1)]
                     
                     stats['optimization'] = {
-                        'stops_optimized': len(optimized_stops),
+                        'stops_optimized': len(route),
                         'total_distance_km': round(total_distance, 2),
                         'distance_saved_km': round(distance_saved, 2),
                         'improvement_percentage': f"{improvement_pct:.1f}%",
                         'optimization_time_seconds': round(optimization_time, 2)
                     }
                     
-                    logger.info(f"Optimization complete: {distance_saved:.2f}km saved ({improvement_pct:.1f}% improvement)")
-                    logger.info(f"Route optimization completed in {optimization_time:.2f} seconds")
+                    logger.info("Optimization complete: %.2fkm saved (%.1f%% improvement)", distance_saved, improvement_pct)
+                    logger.info("Route optimization completed in %.2f seconds", optimization_time)
                     
-                    return jsonify({
+                    return json_response({
                         'success': True,
                         'message': 'Route optimization completed successfully',
                         'stats': stats,
@@ -901,12 +1366,12 @@ def upload_file():
                     return jsonify({
                         'error': 'Not enough geocoded addresses for route optimization',
                         'geocoded_count': geocoded_count,
-                        'total_addresses': len(main_route_data),
+                        'total_addresses': total_addresses,
                         'note': 'Need at least 2 valid addresses for optimization'
                     }), 400
                     
             except Exception as e:
-                logger.error(f"Error during route optimization: {str(e)}")
+                logger.error("Error during route optimization: %s", e)
                 return jsonify({
                     'error': f'Optimization error: {str(e)}',
                     'stats': stats
@@ -919,17 +1384,25 @@ def upload_file():
             }), 400
         
     except Exception as e:
-        logger.error(f"Error processing CSV: {str(e)}")
+        logger.error("Error processing CSV: %s", e)
         return jsonify({'error': f'Error processing file: {str(e)}'}), 500
 
 @app.route('/health')
 def health():
     """Health check endpoint"""
+    # Addresses geocoded at runtime live in the persistent cache, reported apart from the embedded ones
+    geocoding_cache = _persisted_coords.cache_info()._asdict()
+    try:
+        with _GEOCODE_DB_LOCK:
+            geocoding_cache['persisted_addresses'] = _GEOCODE_DB.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+    except sqlite3.Error as e:
+        logger.warning("Could not count persisted geocoding results: %s", e)
     return jsonify({
         'status': 'healthy',
         'message': 'Route Optimizer - Full Vercel Deployment',
-        'api_key_configured': bool(OPENROUTESERVICE_API_KEY),
+        'api_key_configured': _HAS_API,
         'cached_addresses': len(GEOCODING_CACHE),
+        'geocoding_cache': geocoding_cache,
         'version': 'vercel-full-functionality',
         'platform': 'vercel'
     })
@@ -1,10 +1,38 @@
 from flask import Flask, request, jsonify, render_template
 import pandas as pd
+import numpy as np
 import os
 from werkzeug.utils import secure_filename
 import logging
 from route_optimizer import RouteOptimizer
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import re
+import codecs
+import uuid
+import json
+import glob
+import hashlib
+import tempfile
+from io import BytesIO
+from functools import lru_cache
+
+# Optional streaming multipart parser - falls back to Werkzeug's form parser when missing
+try:
+    from streaming_form_data import StreamingFormDataParser
+    from streaming_form_data.targets import ValueTarget
+    STREAMING_UPLOAD_AVAILABLE = True
+except ImportError:
+    STREAMING_UPLOAD_AVAILABLE = False
+
+# orjson is optional - when present the large upload responses are serialized in native code
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,10 +40,9 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-app.config['UPLOAD_FOLDER'] = 'uploads'
-
-# Create uploads folder if it doesn't exist
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+# Processed uploads, including the customer rows, are kept here - outside the working directory unless configured
+app.config['RESULT_CACHE_FOLDER'] = os.path.abspath(
+    os.environ.get('RESULT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'route_result_cache')))
 
 # OpenRouteService API Key configuration
 # You can set this via environment variable: set OPENROUTESERVICE_API_KEY=your_api_key_here
@@ -26,15 +53,216 @@ if OPENROUTESERVICE_API_KEY:
 else:
     logger.info("No API key found in environment")
 
+# One optimizer per process so the rate limiters, cache connections and cache endpoints share state across requests
+OPTIMIZER = RouteOptimizer(ors_api_key=OPENROUTESERVICE_API_KEY)
+# Serializes optimization runs and cache clears when Flask serves requests on multiple threads
+OPTIMIZER_LOCK = threading.Lock()
+
+# Background upload processing for /upload?async=1, keyed by job id until the result is collected.
+# Two workers are enough since optimization runs are serialized by OPTIMIZER_LOCK anyway
+UPLOAD_EXECUTOR = ThreadPoolExecutor(max_workers=2)
+UPLOAD_JOBS = {}
+# Guards UPLOAD_JOBS, which submits, polls and evictions change from different request threads
+UPLOAD_JOBS_LOCK = threading.Lock()
+# Finished jobs that were never collected are dropped after this many seconds
+UPLOAD_JOB_MAX_AGE = 60 * 60
+
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'csv'}
 
+# CSV separators accepted for uploads, in order of preference
+CSV_SEPARATORS = [',', ';', '\t']
+CSV_SNIFF_BYTES = 65536
+# Encoding used when the head of an upload is not valid UTF-8 - accepts any byte sequence
+CSV_FALLBACK_ENCODING = 'latin-1'
+
+# Chunk size used when streaming a multipart upload body
+UPLOAD_CHUNK_BYTES = 65536
+
+# Rows measured when estimating the memory footprint shown in the upload stats
+MEMORY_SAMPLE_ROWS = 1000
+
+# Processed upload responses kept on disk, keyed by file content and algorithm
+RESULT_CACHE_MAX_ENTRIES = 32
+# Retention in seconds, 0 turns the result cache off
+RESULT_CACHE_MAX_AGE = int(os.environ.get('RESULT_CACHE_MAX_AGE', 24 * 60 * 60))
+
+# Define required column patterns and their variations, in order of preference
+REQUIRED_COLUMN_PATTERNS = {
+    'route': ['route', 'tour', 'trip', 'planned_trip', 'planned trip', 'vehicle', 'driver'],
+    'customer': ['name', 'customer', 'consignee', 'company'],
+    'street': ['street', 'address', 'addr', 'strasse', 'straße'],
+    'postal_code': ['postal', 'post', 'zip', 'plz', 'postcode', 'post code'],
+    'city': ['city', 'ort', 'town', 'place'],
+    'tracking': ['tracking', 'shipment', 'number', 'id']
+}
+
+# Column types that decide whether a file can be routed at all
+ROUTING_COLUMN_TYPES = ('route', 'street', 'postal_code', 'city')
+
+# Keywords that mark a column as a route identifier in the upload stats
+ROUTE_KEYWORDS_RE = re.compile('route|tour|trip')
+
+# Keywords that mark a row as the real header row in exports with leading description rows
+HEADER_KEYWORDS_RE = re.compile('shipment|tracking|transport|planned|street|post|city')
+
+# One alternation per column type, used to pick candidate columns in a single vectorized pass
+_PATTERN_RE = {req_type: re.compile('|'.join(map(re.escape, patterns)))
+               for req_type, patterns in REQUIRED_COLUMN_PATTERNS.items()}
+
+def json_response(payload, status=200):
+    """JSON response via orjson when installed (keys sorted like jsonify), jsonify otherwise"""
+    if ORJSON_AVAILABLE:
+        try:
+            body = orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS)
+            return app.response_class(body, status=status, mimetype='application/json')
+        except TypeError:
+            # orjson.JSONEncodeError is a TypeError - leave unusual payloads to Flask's encoder
+            pass
+    return jsonify(payload), status
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def validate_route_data(df):
-    """Validate that the DataFrame contains required columns for route optimization"""
+def stream_upload():
+    """Stream the multipart request body into memory without Werkzeug's form parser.
+    
+    Returns (original filename or None, file content, algorithm form value).
+    """
+    file_target = ValueTarget()
+    algorithm_target = ValueTarget()
+    
+    parser = StreamingFormDataParser(headers=request.headers)
+    parser.register('file', file_target)
+    parser.register('algorithm', algorithm_target)
+    while chunk := request.stream.read(UPLOAD_CHUNK_BYTES):
+        parser.data_received(chunk)
+    
+    return file_target.multipart_filename, file_target.value, algorithm_target.value.decode('utf-8', 'replace')
+
+def result_cache_key(content, algorithm):
+    """Hash the uploaded file content together with the requested algorithm"""
+    digest = hashlib.blake2b(content, digest_size=16)
+    digest.update(algorithm.encode('utf-8'))
+    return digest.hexdigest()
+
+def load_cached_result(key):
+    """Return a cached upload response if one exists and is still fresh, otherwise None"""
+    path = os.path.join(app.config['RESULT_CACHE_FOLDER'], f"{key}.json")
+    try:
+        if time.time() - os.path.getmtime(path) > RESULT_CACHE_MAX_AGE:
+            return None
+        with open(path, encoding='utf-8') as f:
+            result = json.load(f)
+        os.utime(path)  # Mark as recently used for eviction
+        return result
+    except (OSError, ValueError):
+        return None
+
+def store_cached_result(key, result):
+    """Write an upload response to the result cache and evict the least recently used entries, True once stored"""
+    if RESULT_CACHE_MAX_AGE <= 0:
+        return False
+    folder = app.config['RESULT_CACHE_FOLDER']
+    path = os.path.join(folder, f"{key}.json")
+    try:
+        os.makedirs(folder, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        os.replace(tmp_path, path)
+        
+        entries = sorted(glob.glob(os.path.join(folder, '*.json')), key=os.path.getmtime)
+        for old_path in entries[:-RESULT_CACHE_MAX_ENTRIES]:
+            os.remove(old_path)
+        return True
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"Could not cache upload result: {e}")
+        return False
+
+def clear_result_cache():
+    """Remove all cached upload responses"""
+    for path in glob.glob(os.path.join(app.config['RESULT_CACHE_FOLDER'], '*.json')):
+        os.remove(path)
+
+def detect_encodings(raw):
+    """Candidate encodings for uploaded CSV bytes, most likely first, from the BOM or a UTF-8 check of the head"""
+    if raw.startswith(codecs.BOM_UTF8):
+        return ['utf-8']
+    if raw.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return ['utf-16']
+    try:
+        # Incremental decode so a multi-byte character cut off at the sample boundary is not an error
+        codecs.getincrementaldecoder('utf-8')().decode(raw[:CSV_SNIFF_BYTES], final=False)
+    except UnicodeDecodeError:
+        return [CSV_FALLBACK_ENCODING]
+    # Invalid bytes may still appear after the sampled head
+    return ['utf-8', CSV_FALLBACK_ENCODING]
+
+def read_csv_content(raw):
+    """Parse uploaded CSV bytes with a sniffed separator, returns (DataFrame, config description) or (None, None)"""
+    encodings = detect_encodings(raw)
+    
+    # Sniff the separator once from the head of the file
+    separators_to_try = list(CSV_SEPARATORS)
+    try:
+        sample = raw[:CSV_SNIFF_BYTES].decode(encodings[0], errors='ignore')
+        dialect = csv.Sniffer().sniff(sample, delimiters=''.join(CSV_SEPARATORS))
+        separators_to_try.remove(dialect.delimiter)
+        separators_to_try.insert(0, dialect.delimiter)
+    except csv.Error:
+        pass
+    
+    # The C engine decodes the bytes itself (UTF-8 natively) - an encoding is only abandoned when it fails to decode
+    for encoding in encodings:
+        for separator in separators_to_try:
+            try:
+                temp_df = pd.read_csv(BytesIO(raw), sep=separator, encoding=encoding)
+            except UnicodeDecodeError:
+                break
+            except Exception:
+                continue
+            # Check if we got reasonable data (more than 1 column and some non-empty rows)
+            if len(temp_df.columns) > 1 and len(temp_df) > 0:
+                successful_config = f"separator='{separator}', encoding='{encoding}'"
+                logger.info(f"Successfully read CSV with {successful_config}")
+                return temp_df, successful_config
+        else:
+            # Decoded fine but no separator produced usable data
+            return None, None
+    
+    return None, None
+
+@lru_cache(maxsize=128)
+def lowercase_columns(column_names):
+    """Lowercased, stripped column names, shared by the route column sniffer and the column matching"""
+    return tuple(pd.Index(column_names, dtype=object).astype(str).str.lower().str.strip())
+
+@lru_cache(maxsize=128)
+def match_columns(column_names, req_types=tuple(REQUIRED_COLUMN_PATTERNS)):
+    """Map each requested column type to the matching column name (or None) for a tuple of column names"""
+    # Get actual column names (case-insensitive)
+    columns = pd.Index(column_names, dtype=object)
+    lowered = pd.Index(lowercase_columns(column_names), dtype=object)
+    
+    # The regex narrows each type to the columns containing one of its patterns,
+    # then the earliest pattern with a matching column wins
+    found_columns = {}
+    for req_type in req_types:
+        patterns = REQUIRED_COLUMN_PATTERNS[req_type]
+        mask = lowered.str.contains(_PATTERN_RE[req_type], regex=True)
+        candidates = list(zip(lowered[mask], columns[mask]))
+        found_columns[req_type] = next((col for pattern in patterns
+                                        for lowered_col, col in candidates if pattern in lowered_col), None)
+    return found_columns
+
+def validate_route_data(df, strict=False):
+    """Validate that the DataFrame contains required columns for route optimization.
+    
+    Only the route and address columns decide routing readiness; strict=True also looks for
+    customer and tracking columns to report them in the UI suggestions and warnings.
+    """
     validation_result = {
         'is_valid': True,
         'missing_columns': [],
@@ -44,32 +272,9 @@ def validate_route_data(df):
         'warnings': []
     }
     
-    # Define required column patterns and their variations
-    required_patterns = {
-        'route': ['route', 'tour', 'trip', 'planned_trip', 'planned trip', 'vehicle', 'driver'],
-        'customer': ['name', 'customer', 'consignee', 'company'],
-        'street': ['street', 'address', 'addr', 'strasse', 'straße'],
-        'postal_code': ['postal', 'post', 'zip', 'plz', 'postcode', 'post code'],
-        'city': ['city', 'ort', 'town', 'place'],
-        'tracking': ['tracking', 'shipment', 'number', 'id']
-    }
-    
-    # Get actual column names (case-insensitive)
-    actual_columns = [col.lower().strip() for col in df.columns]
-    column_mapping = {col.lower().strip(): col for col in df.columns}
-    
-    # Find matching columns
-    found_columns = {}
-    for req_type, patterns in required_patterns.items():
-        found_column = None
-        for pattern in patterns:
-            for actual_col in actual_columns:
-                if pattern in actual_col or actual_col in pattern:
-                    found_column = column_mapping[actual_col]
-                    break
-            if found_column:
-                break
-        found_columns[req_type] = found_column
+    # Find matching columns - memoized per header, since uploads usually share a few export templates
+    req_types = tuple(REQUIRED_COLUMN_PATTERNS) if strict else ROUTING_COLUMN_TYPES
+    found_columns = dict(match_columns(tuple(df.columns), req_types))
     
     # Check for route column (most critical)
     if found_columns['route']:
@@ -103,28 +308,43 @@ def validate_route_data(df):
         validation_result['suggestions'].append(f"✅ Found address components: {', '.join(validation_result['address_columns'].keys())}")
     
     # Check for customer/tracking info
-    if found_columns['customer']:
-        validation_result['suggestions'].append(f"✅ Customer info found in '{found_columns['customer']}'")
-    else:
-        validation_result['warnings'].append("No customer name column found")
-        
-    if found_columns['tracking']:
-        validation_result['suggestions'].append(f"✅ Tracking info found in '{found_columns['tracking']}'")
-    else:
-        validation_result['warnings'].append("No tracking/shipment number column found")
+    if strict:
+        if found_columns['customer']:
+            validation_result['suggestions'].append(f"✅ Customer info found in '{found_columns['customer']}'")
+        else:
+            validation_result['warnings'].append("No customer name column found")
+            
+        if found_columns['tracking']:
+            validation_result['suggestions'].append(f"✅ Tracking info found in '{found_columns['tracking']}'")
+        else:
+            validation_result['warnings'].append("No tracking/shipment number column found")
     
     # Data quality checks
     if validation_result['is_valid']:
         # Check for empty values in critical columns
-        critical_cols = [validation_result['route_column']] + list(validation_result['address_columns'].values())
-        for col in critical_cols:
-            if col and df[col].isna().sum() > 0:
-                empty_count = df[col].isna().sum()
+        critical_cols = [col for col in [validation_result['route_column']] + list(validation_result['address_columns'].values()) if col]
+        na_counts = df[critical_cols].isna().sum()
+        for col, empty_count in na_counts.items():
+            if empty_count > 0:
                 empty_pct = (empty_count / len(df)) * 100
                 validation_result['warnings'].append(f"Column '{col}' has {empty_count} empty values ({empty_pct:.1f}%)")
     
     return validation_result
 
+def estimate_memory_usage(df):
+    """Estimate the deep memory footprint in bytes, measuring a row sample on large frames"""
+    if len(df) <= MEMORY_SAMPLE_ROWS:
+        return df.memory_usage(deep=True).sum()
+    sample = df.sample(MEMORY_SAMPLE_ROWS, random_state=0)
+    column_bytes = sample.memory_usage(deep=True, index=False).sum() * len(df) / MEMORY_SAMPLE_ROWS
+    return column_bytes + df.index.memory_usage(deep=True)
+
+def column_values(df, column, default):
+    """Return a column as an object array of strings, or the default repeated when the column is missing"""
+    if column in df.columns:
+        return df[column].astype(str).to_numpy(dtype=object)
+    return np.full(len(df), default, dtype=object)
+
 @app.route('/')
 def index():
     """Main page"""
@@ -134,278 +354,393 @@ def index():
 def upload_file():
     """Handle CSV file upload and process with pandas"""
     try:
-        # Check if file is in request
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
-        
-        file = request.files['file']
-        
-        # Check if file is selected
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-            
-        # Check if file is allowed
-        if not allowed_file(file.filename):
-            return jsonify({'error': 'Only CSV files are allowed'}), 400
-        
-        # Save file securely
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        # Read CSV with pandas - try different separators and encodings
-        separators_to_try = [',', ';', '\t']
-        encodings_to_try = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-        
-        df = None
-        successful_config = None
-        
-        for separator in separators_to_try:
-            for encoding in encodings_to_try:
-                try:
-                    temp_df = pd.read_csv(filepath, encoding=encoding, sep=separator)
-                    # Check if we got reasonable data (more than 1 column and some non-empty rows)
-                    if len(temp_df.columns) > 1 and len(temp_df) > 0:
-                        df = temp_df
-                        successful_config = f"separator='{separator}', encoding='{encoding}'"
-                        logger.info(f"Successfully read CSV with {successful_config}")
-                        break
-                except Exception as e:
-                    continue
-            if df is not None:
-                break
-        
-        if df is None:
-            raise Exception("Could not parse CSV file with any combination of separators (comma, semicolon, tab) and encodings")
+        # Stream the body when possible, otherwise use Werkzeug's parsed files
+        file = None
+        content = None
+        if STREAMING_UPLOAD_AVAILABLE and request.mimetype == 'multipart/form-data':
+            upload_name, content, requested_algorithm = stream_upload()
+        else:
+            file = request.files.get('file')
+            upload_name = file.filename if file is not None else None
+            requested_algorithm = request.form.get('algorithm', 'both')
+        
+        # Check if file is in request, selected and allowed
+        error = None
+        if upload_name is None:
+            error = 'No file provided'
+        elif upload_name == '':
+            error = 'No file selected'
+        elif not allowed_file(upload_name):
+            error = 'Only CSV files are allowed'
+        if error:
+            return jsonify({'error': error}), 400
+        
+        # Parse from memory - the body is capped by MAX_CONTENT_LENGTH, so no disk round-trip is needed
+        filename = secure_filename(upload_name)
+        if content is None:
+            content = file.read()
+        
+        # Identical uploads with the same algorithm reuse the previous response
+        cache_key = result_cache_key(content, requested_algorithm)
+        cached_result = load_cached_result(cache_key)
+        if cached_result is not None:
+            cached_result['stats']['filename'] = filename
+            logger.info(f"Result cache hit for {filename}")
+            return upload_response(cached_result, cache_key)
+        
+        # Large uploads can be processed in the background with /upload?async=1 and polled via /jobs/<job_id>
+        if query_flag('async'):
+            evict_stale_jobs()
+            job_id = uuid.uuid4().hex
+            future = UPLOAD_EXECUTOR.submit(process_upload, content, filename, requested_algorithm, cache_key)
+            with UPLOAD_JOBS_LOCK:
+                UPLOAD_JOBS[job_id] = (future, time.time())
+            logger.info(f"Queued upload {filename} as job {job_id}")
+            return jsonify({'success': True, 'job_id': job_id, 'status': 'pending'}), 202
+        
+        return upload_response(*process_upload(content, filename, requested_algorithm, cache_key))
         
-        # Clean up the data - remove empty rows and fix headers
-        # Check if first row might be a description row
-        if len(df) > 0:
-            # Remove rows where all values are empty or NaN
-            df = df.dropna(how='all')
+    except Exception as e:
+        logger.error(f"Error processing CSV: {str(e)}")
+        return jsonify({'error': f'Error processing file: {str(e)}'}), 500
+
+def evict_stale_jobs():
+    """Forget finished background jobs whose result was not collected within UPLOAD_JOB_MAX_AGE"""
+    cutoff = time.time() - UPLOAD_JOB_MAX_AGE
+    with UPLOAD_JOBS_LOCK:
+        for job_id, (future, submitted_at) in list(UPLOAD_JOBS.items()):
+            if submitted_at < cutoff and future.done():
+                del UPLOAD_JOBS[job_id]
+
+def query_flag(name):
+    """True when an opt-in query parameter such as ?async=1 is set"""
+    return request.args.get(name, '').lower() in ('1', 'true', 'yes')
+
+def upload_response(result, upload_id):
+    """Send an upload result, keeping only the summary and route ids when ?paginate=1 is set.
+    
+    Per-route details are then served by /routes/<upload_id>/<route_id> from the result cache,
+    so results that were not cached (upload_id None) are always sent in full. With ?paginate=1 the
+    optimization stats carry 'paginated' to tell the two cases apart.
+    """
+    optimization = result['stats'].get('optimization', {})
+    if not query_flag('paginate') or 'route_comparisons' not in optimization:
+        return json_response(result)
+    
+    if upload_id is None:
+        paged = {**optimization, 'paginated': False}
+    else:
+        paged = {key: value for key, value in optimization.items()
+                 if key not in ('route_comparisons', 'optimized_data')}
+        paged['route_ids'] = [comparison['route_id'] for comparison in optimization['route_comparisons']]
+        paged['upload_id'] = upload_id
+        paged['paginated'] = True
+    return json_response({**result, 'stats': {**result['stats'], 'optimization': paged}})
+
+def process_upload(content, filename, requested_algorithm, cache_key):
+    """Parse, validate and optimize an uploaded CSV, returns (response payload, cache key or None if not cached)"""
+    # Read CSV with pandas - detect the encoding and separator once instead of probing every combination
+    df, successful_config = read_csv_content(content)
+    
+    if df is None:
+        raise Exception("Could not parse CSV file with any combination of separators (comma, semicolon, tab) and encodings")
+    
+    # Clean up the data - remove empty rows and fix headers
+    # Check if first row might be a description row
+    if len(df) > 0:
+        # Remove rows where all values are empty or NaN
+        df = df.dropna(how='all')
+        
+        # Check if we need to skip description rows (common in German CSV exports)
+        # Look for rows that might be actual headers
+        # A keyword cannot span two cells, so each column is scanned on its own and the hits OR-ed together
+        header_hits = np.zeros(len(df), dtype=bool)
+        for col in df.columns:
+            values = df[col]
+            header_hits |= (values.notna() & values.astype(str).str.lower().str.contains(HEADER_KEYWORDS_RE)).to_numpy(dtype=bool)
+        
+        # If we found a better header row, use it
+        if header_hits.any():
+            header_idx = df.index[header_hits.argmax()]
+            if header_idx > 0:
+                # Use the row as new header and drop previous rows
+                df.columns = df.iloc[header_idx].values
+                df = df.iloc[header_idx + 1:].reset_index(drop=True)
+                logger.info(f"Detected and used header row at index {header_idx}")
+        
+        # Clean column names - remove empty/unnamed columns
+        df.columns = [col if not (pd.isna(col) or str(col).startswith('Unnamed')) else f'Column_{i}' 
+                     for i, col in enumerate(df.columns)]
+        
+        # Remove completely empty columns
+        df = df.dropna(axis=1, how='all')
+    
+    # Log basic info
+    logger.info(f"Loaded CSV: {filename}")
+    logger.info(f"Shape after cleaning: {df.shape}")
+    logger.info(f"Columns: {list(df.columns)}")
+    
+    # Basic data analysis
+    stats = {
+        'filename': filename,
+        'total_rows': len(df),
+        'total_columns': len(df.columns),
+        'columns': list(df.columns),
+        'memory_usage': f"{estimate_memory_usage(df) / 1024:.1f} KB"
+    }
+    
+    # Check for route-related columns
+    route_columns = [col for col, lowered_col in zip(df.columns, lowercase_columns(tuple(df.columns)))
+                     if ROUTE_KEYWORDS_RE.search(lowered_col)]
+    
+    if route_columns:
+        stats['route_columns'] = route_columns
+        # Count unique routes
+        for route_col in route_columns:
+            unique_routes = df[route_col].nunique()
+            stats[f'unique_{route_col}'] = unique_routes
+    
+    # Sample data (first 5 rows) - replace NaN with None for JSON serialization
+    sample_df = df.head().fillna('')  # Replace NaN with empty strings
+    stats['sample_data'] = sample_df.to_dict('records')
+    
+    # Validate route data
+    validation = validate_route_data(df, strict=True)
+    stats['validation'] = validation
+    
+    # Route optimization (if validation passes)
+    optimization_results = None
+    fallback_used = False
+    if validation['is_valid']:
+        # Few routes over many stops - grouping and route filters then work on small integer codes
+        df[validation['route_column']] = df[validation['route_column']].astype('category')
+        try:
+            # Get algorithm from request (default to 'both')
+            algorithm = requested_algorithm
+            if algorithm not in ['nearest_neighbor', '2_opt', 'both']:
+                algorithm = 'both'
             
-            # Check if we need to skip description rows (common in German CSV exports)
-            # Look for rows that might be actual headers
-            potential_header_indices = []
-            for idx, row in df.iterrows():
-                row_str = ' '.join(str(val) for val in row.values if pd.notna(val)).lower()
-                if any(keyword in row_str for keyword in ['shipment', 'tracking', 'transport', 'planned', 'street', 'post', 'city']):
-                    potential_header_indices.append(idx)
+            logger.info(f"Starting route optimization with {algorithm} algorithm")
+            start_time = time.time()
             
-            # If we found a better header row, use it
-            if potential_header_indices:
-                header_idx = potential_header_indices[0]
-                if header_idx > 0:
-                    # Use the row as new header and drop previous rows
-                    df.columns = df.iloc[header_idx].values
-                    df = df.iloc[header_idx + 1:].reset_index(drop=True)
-                    logger.info(f"Detected and used header row at index {header_idx}")
+            optimizer = OPTIMIZER
             
-            # Clean column names - remove empty/unnamed columns
-            df.columns = [col if not (pd.isna(col) or str(col).startswith('Unnamed')) else f'Column_{i}' 
-                         for i, col in enumerate(df.columns)]
+            # Count total stops for progress tracking
+            total_stops = len(df)
+            routing_mode = "road routing (with air distance fallback)" if optimizer.ors_client else "air distance only"
+            logger.info(f"Will geocode {total_stops} addresses and calculate distances using {routing_mode}")
             
-            # Remove completely empty columns
-            df = df.dropna(axis=1, how='all')
-        
-        # Log basic info
-        logger.info(f"Loaded CSV: {filename}")
-        logger.info(f"Shape after cleaning: {df.shape}")
-        logger.info(f"Columns: {list(df.columns)}")
-        
-        # Basic data analysis
-        stats = {
-            'filename': filename,
-            'total_rows': len(df),
-            'total_columns': len(df.columns),
-            'columns': list(df.columns),
-            'memory_usage': f"{df.memory_usage(deep=True).sum() / 1024:.1f} KB"
-        }
-        
-        # Check for route-related columns
-        route_columns = []
-        for col in df.columns:
-            if any(keyword in col.lower() for keyword in ['route', 'tour', 'trip']):
-                route_columns.append(col)
-        
-        if route_columns:
-            stats['route_columns'] = route_columns
-            # Count unique routes
-            for route_col in route_columns:
-                unique_routes = df[route_col].nunique()
-                stats[f'unique_{route_col}'] = unique_routes
-        
-        # Sample data (first 5 rows) - replace NaN with None for JSON serialization
-        sample_df = df.head().fillna('')  # Replace NaN with empty strings
-        stats['sample_data'] = sample_df.to_dict('records')
-        
-        # Validate route data
-        validation = validate_route_data(df)
-        stats['validation'] = validation
-        
-        # Route optimization (if validation passes)
-        optimization_results = None
-        if validation['is_valid']:
+            # Optimize routes
+            logger.info("Starting optimize_multiple_routes...")
             try:
-                # Get algorithm from request (default to 'both')
-                algorithm = request.form.get('algorithm', 'both')
-                if algorithm not in ['nearest_neighbor', '2_opt', 'both']:
-                    algorithm = 'both'
-                
-                logger.info(f"Starting route optimization with {algorithm} algorithm")
-                start_time = time.time()
-                
-                # Initialize optimizer
-                try:
-                    optimizer = RouteOptimizer(ors_api_key=OPENROUTESERVICE_API_KEY)
-                    logger.info("RouteOptimizer initialized successfully")
-                except Exception as e:
-                    logger.error(f"Failed to initialize RouteOptimizer: {e}")
-                    raise e
-                
-                # Count total stops for progress tracking
-                total_stops = len(df)
-                routing_mode = "road routing (with air distance fallback)" if optimizer.ors_client else "air distance only"
-                logger.info(f"Will geocode {total_stops} addresses and calculate distances using {routing_mode}")
-                
-                # Optimize routes
-                logger.info("Starting optimize_multiple_routes...")
-                try:
+                with OPTIMIZER_LOCK:
                     optimization_results = optimizer.optimize_multiple_routes(
                         df=df,
                         route_column=validation['route_column'],
                         address_columns=validation['address_columns'],
                         algorithm=algorithm
                     )
-                    logger.info("Route optimization completed successfully")
-                except Exception as e:
-                    logger.error(f"Route optimization failed: {e}")
-                    raise e
+                logger.info("Route optimization completed successfully")
+            except Exception as e:
+                logger.error(f"Route optimization failed: {e}")
+                raise e
+            
+            # Create optimized dataframe
+            optimized_df = optimizer.create_optimized_dataframe(
+                original_df=df,
+                optimization_results=optimization_results,
+                route_column=validation['route_column']
+            )
+            
+            # Prepare detailed route comparison - group once instead of scanning the route column per route,
+            # and stringify the stop fields once for the whole frame
+            route_comparisons = []
+            route_positions = df.groupby(validation['route_column'], sort=False, observed=True).indices
+            address_columns = validation['address_columns']
+            customers = column_values(df, address_columns.get('customer', ''), 'Unknown')
+            streets = column_values(df, address_columns.get('street', ''), '')
+            postal_codes = column_values(df, address_columns.get('postal_code', ''), '')
+            cities = column_values(df, address_columns.get('city', ''), '')
+            # Coordinates by (street, postal_code, city), filled in one batch per route and reused across routes
+            coords_map = {}
+            for route_id, route_result in optimization_results['routes'].items():
+                # Row positions of the original route, in file order
+                positions = route_positions[route_id]
                 
-                # Create optimized dataframe
-                optimized_df = optimizer.create_optimized_dataframe(
-                    original_df=df,
-                    optimization_results=optimization_results,
-                    route_column=validation['route_column']
-                )
+                # Create route comparison
+                comparison = {
+                    'route_id': route_id,
+                    'stops_count': route_result['stops_count'],
+                    'algorithm_used': route_result['algorithm_used'],
+                    'original_distance_km': route_result['original_distance'],
+                    'optimized_distance_km': route_result['optimized_distance'],
+                    'distance_saved_km': route_result['distance_saved'],
+                    'improvement_percentage': route_result['improvement_pct'],
+                    'processing_time_seconds': route_result['processing_time'],
+                    'original_stops': [],
+                    'optimized_stops': [],
+                    'original_segments': route_result.get('original_segments', []),
+                    'optimized_segments': route_result.get('optimized_segments', [])
+                }
                 
-                # Prepare detailed route comparison
-                route_comparisons = []
-                for route_id, route_result in optimization_results['routes'].items():
-                    # Get original route data
-                    original_route = df[df[validation['route_column']] == route_id].copy()
+                # Add stop details for routes with multiple stops
+                if route_result['stops_count'] > 1:
+                    original_columns = list(zip(
+                        customers[positions], streets[positions], postal_codes[positions], cities[positions]
+                    ))
+                    stops = route_result['stops']
                     
-                    # Create route comparison
-                    comparison = {
-                        'route_id': route_id,
-                        'stops_count': route_result['stops_count'],
-                        'algorithm_used': route_result['algorithm_used'],
-                        'original_distance_km': route_result['original_distance'],
-                        'optimized_distance_km': route_result['optimized_distance'],
-                        'distance_saved_km': route_result['distance_saved'],
-                        'improvement_percentage': route_result['improvement_pct'],
-                        'processing_time_seconds': route_result['processing_time'],
-                        'original_stops': [],
-                        'optimized_stops': [],
-                        'original_segments': route_result.get('original_segments', []),
-                        'optimized_segments': route_result.get('optimized_segments', [])
-                    }
+                    # Look up every address this route still needs in one batch
+                    lookup_keys = [(street, postal_code, city) for _, street, postal_code, city in original_columns]
+                    lookup_keys += [(stop['street'], stop['postal_code'], stop['city'])
+                                    for stop in stops if '_coordinates' not in stop]
+                    with OPTIMIZER_LOCK:
+                        coords_map.update(optimizer.get_coordinates_batch(
+                            [key for key in lookup_keys if key not in coords_map]))
                     
-                    # Add stop details for routes with multiple stops
-                    if route_result['stops_count'] > 1:
-                        # Original order
-                        for i, (_, row) in enumerate(original_route.iterrows()):
-                            stop_info = {
-                                'stop_number': i + 1,
-                                'customer': str(row.get(validation['address_columns'].get('customer', ''), 'Unknown')),
-                                'street': str(row.get(validation['address_columns'].get('street', ''), '')),
-                                'postal_code': str(row.get(validation['address_columns'].get('postal_code', ''), '')),
-                                'city': str(row.get(validation['address_columns'].get('city', ''), '')),
-                            }
-                            # Add coordinates using the new method
-                            coords = optimizer.get_coordinates(stop_info)
-                            stop_info['coordinates'] = {'lat': coords[0], 'lng': coords[1]}
-                            comparison['original_stops'].append(stop_info)
-                        
-                        # Optimized order
-                        stops = route_result['stops']
-                        for new_pos, original_pos in enumerate(route_result['optimized_order']):
-                            stop = stops[original_pos]
-                            stop_info = {
-                                'stop_number': new_pos + 1,
-                                'original_position': original_pos + 1,
-                                'customer': stop['customer'],
-                                'street': stop['street'],
-                                'postal_code': stop['postal_code'],
-                                'city': stop['city'],
-                            }
-                            # Use cached coordinates from optimization if available
-                            if '_coordinates' in stop:
-                                coords = stop['_coordinates']
-                            else:
-                                coords = optimizer.get_coordinates(stop_info)
-                            stop_info['coordinates'] = {'lat': coords[0], 'lng': coords[1]}
-                            comparison['optimized_stops'].append(stop_info)
-                    else:
-                        # Single stop route
+                    # Original order
+                    for i, (customer, street, postal_code, city) in enumerate(original_columns):
                         stop_info = {
-                            'stop_number': 1,
-                            'customer': route_result['stops'][0]['customer'] if route_result['stops'] else 'Unknown',
-                            'street': route_result['stops'][0]['street'] if route_result['stops'] else '',
-                            'postal_code': route_result['stops'][0]['postal_code'] if route_result['stops'] else '',
-                            'city': route_result['stops'][0]['city'] if route_result['stops'] else '',
+                            'stop_number': i + 1,
+                            'customer': customer,
+                            'street': street,
+                            'postal_code': postal_code,
+                            'city': city,
                         }
-                        coords = optimizer.get_coordinates(stop_info)
+                        coords = coords_map[(street, postal_code, city)]
                         stop_info['coordinates'] = {'lat': coords[0], 'lng': coords[1]}
-                        comparison['original_stops'] = [stop_info]
-                        comparison['optimized_stops'] = [stop_info]
+                        comparison['original_stops'].append(stop_info)
                     
-                    route_comparisons.append(comparison)
-                
-                optimization_time = time.time() - start_time
-                logger.info(f"Route optimization completed in {optimization_time:.2f} seconds")
-                
-                # Add optimization results to stats - clean NaN values
-                clean_optimized_df = optimized_df.fillna('')
-                stats['optimization'] = {
-                    'completed': True,
-                    'summary': optimization_results['summary'],
-                    'route_comparisons': route_comparisons,
-                    'optimized_data': clean_optimized_df.to_dict('records'),
-                    'total_processing_time': round(optimization_time, 2)
-                }
+                    # Optimized order
+                    for new_pos, original_pos in enumerate(route_result['optimized_order']):
+                        stop = stops[original_pos]
+                        stop_info = {
+                            'stop_number': new_pos + 1,
+                            'original_position': original_pos + 1,
+                            'customer': stop['customer'],
+                            'street': stop['street'],
+                            'postal_code': stop['postal_code'],
+                            'city': stop['city'],
+                        }
+                        # Use cached coordinates from optimization if available
+                        if '_coordinates' in stop:
+                            coords = stop['_coordinates']
+                        else:
+                            coords = coords_map[(stop['street'], stop['postal_code'], stop['city'])]
+                        stop_info['coordinates'] = {'lat': coords[0], 'lng': coords[1]}
+                        comparison['optimized_stops'].append(stop_info)
+                else:
+                    # Single stop route
+                    stop_info = {
+                        'stop_number': 1,
+                        'customer': route_result['stops'][0]['customer'] if route_result['stops'] else 'Unknown',
+                        'street': route_result['stops'][0]['street'] if route_result['stops'] else '',
+                        'postal_code': route_result['stops'][0]['postal_code'] if route_result['stops'] else '',
+                        'city': route_result['stops'][0]['city'] if route_result['stops'] else '',
+                    }
+                    if route_result['stops'] and '_coordinates' in route_result['stops'][0]:
+                        coords = route_result['stops'][0]['_coordinates']
+                    else:
+                        key = (stop_info['street'], stop_info['postal_code'], stop_info['city'])
+                        if key not in coords_map:
+                            with OPTIMIZER_LOCK:
+                                coords_map.update(optimizer.get_coordinates_batch([key]))
+                        coords = coords_map[key]
+                    stop_info['coordinates'] = {'lat': coords[0], 'lng': coords[1]}
+                    comparison['original_stops'] = [stop_info]
+                    comparison['optimized_stops'] = [stop_info]
                 
-            except Exception as e:
-                logger.error(f"Error during route optimization: {str(e)}")
-                stats['optimization'] = {
-                    'completed': False,
-                    'error': str(e),
-                    'message': 'Route optimization failed but file validation was successful'
-                }
-        else:
+                route_comparisons.append(comparison)
+            
+            optimization_time = time.time() - start_time
+            logger.info(f"Route optimization completed in {optimization_time:.2f} seconds")
+            
+            # Add optimization results to stats - clean NaN values
+            clean_optimized_df = optimized_df.fillna('')
+            # Results built on approximate coordinates or air distance fallbacks are not cached
+            fallback_used = any(r.get('fallback_used') for r in optimization_results['routes'].values())
+            stats['optimization'] = {
+                'completed': True,
+                'summary': optimization_results['summary'],
+                'route_comparisons': route_comparisons,
+                'optimized_data': clean_optimized_df.to_dict('records'),
+                'total_processing_time': round(optimization_time, 2)
+            }
+            
+        except Exception as e:
+            logger.error(f"Error during route optimization: {str(e)}")
             stats['optimization'] = {
                 'completed': False,
-                'message': 'Route optimization skipped due to validation issues',
-                'validation_errors': validation
+                'error': str(e),
+                'message': 'Route optimization failed but file validation was successful'
             }
-        
-        # Clean up - remove uploaded file after processing
-        os.remove(filepath)
-        
-        # Clean data for JSON serialization - replace NaN with empty strings
-        clean_df = df.fillna('')
-        
-        return jsonify({
-            'success': True,
-            'message': 'CSV file processed successfully',
-            'stats': stats,
-            'data': clean_df.to_dict('records')  # Full original data for reference
-        })
-        
+    else:
+        stats['optimization'] = {
+            'completed': False,
+            'message': 'Route optimization skipped due to validation issues',
+            'validation_errors': validation
+        }
+    
+    # Clean data for JSON serialization - replace NaN with empty strings
+    # (categorical columns go back to object first, '' is not one of their categories)
+    clean_df = df.astype({col: object for col in df.select_dtypes('category').columns}).fillna('')
+    
+    result = {
+        'success': True,
+        'message': 'CSV file processed successfully',
+        'stats': stats,
+        'data': clean_df.to_dict('records')  # Full original data for reference
+    }
+    # Failed or degraded optimizations may succeed on retry, so only deterministic outcomes are cached
+    if 'error' not in stats['optimization'] and not fallback_used and store_cached_result(cache_key, result):
+        return result, cache_key
+    
+    return result, None
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll a background upload job; a finished result is handed out once and then forgotten"""
+    # Look up and claim a finished job in one step, so concurrent polls hand its result out only once
+    with UPLOAD_JOBS_LOCK:
+        job = UPLOAD_JOBS.get(job_id)
+        done = job is not None and job[0].done()
+        if done:
+            del UPLOAD_JOBS[job_id]
+    if job is None:
+        return jsonify({'error': 'Unknown job id'}), 404
+    
+    future, _ = job
+    if not done:
+        status = 'running' if future.running() else 'pending'
+        return jsonify({'success': True, 'job_id': job_id, 'status': status}), 202
+    
+    try:
+        return upload_response(*future.result())
     except Exception as e:
         logger.error(f"Error processing CSV: {str(e)}")
         return jsonify({'error': f'Error processing file: {str(e)}'}), 500
 
+@app.route('/routes/<upload_id>/<route_id>', methods=['GET'])
+def get_route_details(upload_id, route_id):
+    """Return one route's comparison and optimized rows from a cached upload result (see ?paginate=1)"""
+    result = load_cached_result(upload_id) if re.fullmatch('[0-9a-f]{32}', upload_id) else None
+    if result is None:
+        return jsonify({'error': 'Unknown or expired upload id'}), 404
+    
+    optimization = result['stats'].get('optimization', {})
+    for comparison in optimization.get('route_comparisons', []):
+        if str(comparison['route_id']) == route_id:
+            route_column = result['stats']['validation']['route_column']
+            optimized_rows = [row for row in optimization.get('optimized_data', [])
+                              if str(row.get(route_column)) == route_id]
+            return json_response({
+                'success': True,
+                'route_comparison': comparison,
+                'optimized_data': optimized_rows
+            })
+    
+    return jsonify({'error': f'Route {route_id} not found'}), 404
+
 @app.route('/optimize', methods=['POST'])
 def optimize_routes():
     """Standalone route optimization endpoint"""
@@ -432,13 +767,14 @@ def optimize_routes():
         logger.info(f"Optimizing routes with {algorithm} algorithm")
         
         # Initialize optimizer and run optimization
-        optimizer = RouteOptimizer(ors_api_key=OPENROUTESERVICE_API_KEY)
-        optimization_results = optimizer.optimize_multiple_routes(
-            df=df,
-            route_column=route_column,
-            address_columns=address_columns,
-            algorithm=algorithm
-        )
+        optimizer = OPTIMIZER
+        with OPTIMIZER_LOCK:
+            optimization_results = optimizer.optimize_multiple_routes(
+                df=df,
+                route_column=route_column,
+                address_columns=address_columns,
+                algorithm=algorithm
+            )
         
         # Create optimized dataframe
         optimized_df = optimizer.create_optimized_dataframe(
@@ -450,7 +786,7 @@ def optimize_routes():
         # Clean optimized data for JSON serialization
         clean_optimized_df = optimized_df.fillna('')
         
-        return jsonify({
+        return json_response({
             'success': True,
             'message': 'Route optimization completed',
             'summary': optimization_results['summary'],
@@ -472,8 +808,7 @@ def optimize_routes():
 def get_cache_stats():
     """Get geocoding cache statistics"""
     try:
-        optimizer = RouteOptimizer(ors_api_key=OPENROUTESERVICE_API_KEY)
-        stats = optimizer.get_cache_stats()
+        stats = OPTIMIZER.get_cache_stats()
         
         return jsonify({
             'success': True,
@@ -486,26 +821,20 @@ def get_cache_stats():
 
 @app.route('/cache/clear', methods=['POST'])
 def clear_cache():
-    """Clear session cache (persistent cache remains)"""
-    try:
-        optimizer = RouteOptimizer(ors_api_key=OPENROUTESERVICE_API_KEY)
-        optimizer.clear_session_cache()
-        
-        return jsonify({
-            'success': True,
-            'message': 'Session cache cleared successfully'
-        })
-        
-    except Exception as e:
-        logger.error(f"Error clearing cache: {str(e)}")
-        return jsonify({'success': False, 'error': str(e)})
+    """Kept for existing clients - there is no session cache any more, lookups use the persistent cache"""
+    return jsonify({
+        'success': True,
+        'message': 'No session cache to clear (persistent cache remains)'
+    })
 
 @app.route('/cache/clear/routing', methods=['POST'])
 def clear_routing_cache():
     """Clear routing cache only"""
     try:
-        optimizer = RouteOptimizer(ors_api_key=OPENROUTESERVICE_API_KEY)
-        optimizer.clear_routing_cache()
+        with OPTIMIZER_LOCK:
+            OPTIMIZER.clear_routing_cache()
+        # Cached upload results hold distances from the cleared routes
+        clear_result_cache()
         
         return jsonify({
             'success': True,
@@ -518,14 +847,15 @@ def clear_routing_cache():
 
 @app.route('/cache/clear/all', methods=['POST'])
 def clear_all_caches():
-    """Clear session and routing caches (keeps geocoding cache)"""
+    """Clear routing and upload result caches (keeps geocoding cache)"""
     try:
-        optimizer = RouteOptimizer(ors_api_key=OPENROUTESERVICE_API_KEY)
-        optimizer.clear_all_caches()
+        with OPTIMIZER_LOCK:
+            OPTIMIZER.clear_all_caches()
+        clear_result_cache()
         
         return jsonify({
             'success': True,
-            'message': 'Session and routing caches cleared successfully'
+            'message': 'Routing and result caches cleared successfully'
         })
         
     except Exception as e:
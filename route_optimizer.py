@@ -1,52 +1,318 @@
 import math
+import numpy as np
 import pandas as pd
 import logging
 from typing import List, Dict, Tuple, Optional
 import time
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut, GeocoderServiceError
+from geopy.extra.rate_limiter import RateLimiter
 import requests
+from requests.adapters import HTTPAdapter
 import sqlite3
 import os
 import hashlib
+import json
+import tempfile
+import zlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 # OpenRouteService will be imported conditionally when needed
 
+# Numba writes its JIT cache next to the source by default, which may not be writable
+os.environ.setdefault('NUMBA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'numba_cache'))
+
+# Numba is optional - without it the route kernels run as plain Python
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """No-op stand-in for numba.njit when numba is not installed"""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
 logger = logging.getLogger(__name__)
 
+# Connection settings for the cache databases: WAL turns the rollback-journal fsyncs of every
+# store into sequential appends and lets reads run alongside writes
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",  # ~8MB page cache, holds the hot geocoded rows
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",  # ms - wait for concurrent writers instead of failing
+)
+
+# UPDATE ... RETURNING (SQLite 3.35+) bumps a hit's usage columns and reads it back in one statement.
+# RETURNING hands back integral REAL values as ints, so readers convert them with float()
+SQLITE_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Nominatim's usage policy allows at most one request per second; batches overlap the network waits
+# of several lookups in threads while the shared rate limiter keeps the request starts paced
+NOMINATIM_MIN_DELAY = 1.0  # seconds
+GEOCODE_WORKERS = 4
+
+# OpenRouteService request sizes: the matrix endpoint takes blocks of up to 50 sources x 50 destinations,
+# a directions request up to 50 waypoints
+ORS_MATRIX_CHUNK = 50
+ORS_DIRECTIONS_WAYPOINTS = 50
+
+# Free tier allows 40 requests per minute: requests run concurrently, paced by a token bucket that refills
+# 35 tokens per minute (some buffer below 40) and holds a burst of ORS_WORKERS, so no 60s window exceeds 40
+ORS_WORKERS = 5
+ORS_REQUESTS_PER_MINUTE = 35
+ORS_MAX_WAIT = 60.0  # seconds, about one minute of budget - longer waits fall back to air distance
+
+# Routes are optimized concurrently in threads: geocoding and ORS waits overlap behind the shared rate
+# limiters, and the compiled 2-opt kernels release the GIL, so the sweeps use several cores
+ROUTE_WORKERS = 4
+
+# Hot-path statements, kept as constants so the connection's statement cache reuses the compiled bytecode
+SQLITE_CACHED_STATEMENTS = 256
+# Keys bound per IN (...) lookup, safely below SQLite's default limit of 999 host parameters
+SQLITE_BATCH_SIZE = 500
+# WITHOUT ROWID stores every row inside the primary-key B-tree, so a lookup finds the payload in one descent
+GEOCODE_TABLE_SQL = ("CREATE TABLE IF NOT EXISTS geocoding_cache ("
+                     "address_hash BLOB PRIMARY KEY, full_address TEXT NOT NULL, "
+                     "latitude REAL NOT NULL, longitude REAL NOT NULL, success_count INTEGER DEFAULT 1, "
+                     "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
+                     ") WITHOUT ROWID")
+GEOCODE_SELECT_SQL = "SELECT latitude, longitude FROM geocoding_cache WHERE address_hash = ?"
+GEOCODE_TOUCH_SQL = ("UPDATE geocoding_cache SET last_used = CURRENT_TIMESTAMP, success_count = success_count + 1 "
+                     "WHERE address_hash = ?")
+GEOCODE_FETCH_SQL = GEOCODE_TOUCH_SQL + " RETURNING latitude, longitude"
+GEOCODE_UPSERT_SQL = ("INSERT OR REPLACE INTO geocoding_cache "
+                      "(address_hash, full_address, latitude, longitude, created_at, last_used) "
+                      "VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)")
+# Routes are keyed by their endpoints in integer microdegrees, so lookups need no hashing
+ROUTE_KEY_COLUMNS = "from_lat_e6, from_lng_e6, to_lat_e6, to_lng_e6"
+ROUTE_KEY_WHERE = "from_lat_e6 = ? AND from_lng_e6 = ? AND to_lat_e6 = ? AND to_lng_e6 = ?"
+ROUTE_TABLE_SQL = ("CREATE TABLE IF NOT EXISTS routing_cache ("
+                   "from_lat_e6 INTEGER NOT NULL, from_lng_e6 INTEGER NOT NULL, "
+                   "to_lat_e6 INTEGER NOT NULL, to_lng_e6 INTEGER NOT NULL, "
+                   "distance_km REAL NOT NULL, duration_minutes REAL NOT NULL, geometry BLOB, "
+                   "profile TEXT DEFAULT 'driving-car', "
+                   "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+                   f"PRIMARY KEY ({ROUTE_KEY_COLUMNS})) WITHOUT ROWID")
+ROUTE_SELECT_SQL = f"SELECT distance_km, duration_minutes, geometry FROM routing_cache WHERE {ROUTE_KEY_WHERE}"
+ROUTE_TOUCH_SQL = f"UPDATE routing_cache SET last_used = CURRENT_TIMESTAMP WHERE {ROUTE_KEY_WHERE}"
+ROUTE_FETCH_SQL = ROUTE_TOUCH_SQL + " RETURNING distance_km, duration_minutes, geometry"
+ROUTE_UPSERT_SQL = ("INSERT OR REPLACE INTO routing_cache "
+                    f"({ROUTE_KEY_COLUMNS}, distance_km, duration_minutes, geometry, profile, created_at, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)")
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    """Open a cache connection with autocommit and the cache PRAGMAs applied"""
+    # A private page cache per connection, never cache=shared: under WAL, readers already run
+    # concurrently with the writer, and a shared cache would serialize them on its own table locks
+    conn = sqlite3.connect(db_path, isolation_level=None, cached_statements=SQLITE_CACHED_STATEMENTS)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+@lru_cache(maxsize=10000)
+def _hash_address(address: str) -> bytes:
+    """Create a hash for the address to use as key"""
+    # Memoized: lookups, stores and the fallback paths hash the same few addresses over and over
+    return hashlib.blake2b(address.lower().strip().encode(), digest_size=16).digest()
+
+@lru_cache(maxsize=10000)
+def _full_address(street: str, postal_code: str, city: str) -> str:
+    """Create the full address string geocoding and the cache keys use"""
+    # Memoized: the same stops are geocoded for the distance matrix and again for the route comparison
+    address_parts = []
+    if street and str(street).strip() and str(street).strip().lower() != 'nan':
+        address_parts.append(str(street).strip())
+    if postal_code and str(postal_code).strip():
+        address_parts.append(str(postal_code).strip())
+    if city and str(city).strip() and str(city).strip().lower() != 'nan':
+        address_parts.append(str(city).strip())
+    
+    return ', '.join(address_parts) + ', Germany'
+
+def encode_geometry(geometry: Dict) -> bytes:
+    """Pack a GeoJSON LineString as zlib-compressed, delta-coded int32 microdegree [lng, lat] pairs"""
+    coordinates = geometry['coordinates']
+    # Elevation, if present, is dropped
+    lnglat = np.asarray(coordinates, dtype=np.float64)[:, :2] if coordinates else np.empty((0, 2))
+    points = np.rint(lnglat * 1e6).astype('<i4')
+    # Consecutive points are close together, so the deltas are small numbers that compress well
+    deltas = np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype='<i4'))
+    return zlib.compress(deltas.tobytes())
+
+def decode_geometry(data) -> Dict:
+    """Unpack a cached route geometry, rows written before encode_geometry hold GeoJSON text"""
+    if isinstance(data, str):
+        return json.loads(data)
+    points = np.frombuffer(zlib.decompress(data), dtype='<i4').reshape(-1, 2).cumsum(axis=0)
+    return {'type': 'LineString', 'coordinates': (points / 1e6).tolist()}
+
+def _to_xyz(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Unit vectors on the sphere for the given coordinates, as an n x 3 array"""
+    lat_rad = np.radians(lats)
+    lon_rad = np.radians(lons)
+    cos_lat = np.cos(lat_rad)
+    return np.column_stack((cos_lat * np.cos(lon_rad), cos_lat * np.sin(lon_rad), np.sin(lat_rad)))
+
+def haversine_matrix(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle distances in km between all pairs of points, as an n x n matrix"""
+    R = 6371  # Earth's radius in km
+    # The trig runs once per point: the chord between two unit vectors is 2*sin(angle/2), so one
+    # arcsin per pair recovers the central angle (the same quantity the haversine formula computes)
+    xyz = _to_xyz(lats, lons)
+    chord_sq = np.zeros((len(xyz), len(xyz)))
+    for k in range(3):
+        # Differences rather than 2 - 2*dot keep nearby and identical points exact
+        diff = xyz[:, k, None] - xyz[None, :, k]
+        chord_sq += diff * diff
+    return R * 2 * np.arcsin(np.minimum(np.sqrt(chord_sq) / 2, 1.0))
+
+def air_distances(from_lats: np.ndarray, from_lons: np.ndarray, to_lats: np.ndarray, to_lons: np.ndarray) -> np.ndarray:
+    """Great-circle distances in km between paired points, element by element"""
+    R = 6371  # Earth's radius in km
+    chord = np.linalg.norm(_to_xyz(from_lats, from_lons) - _to_xyz(to_lats, to_lons), axis=1)
+    return R * 2 * np.arcsin(np.minimum(chord / 2, 1.0))
+
+def stop_coordinates(stops: List[Dict]) -> np.ndarray:
+    """Geocoded stop coordinates as one contiguous n x 2 array of (lat, lng) rows"""
+    return np.array([stop['_coordinates'] for stop in stops], dtype=np.float64).reshape(len(stops), 2)
+
+@njit(cache=True, nogil=True)
+def _nearest_neighbor(dist: np.ndarray, start: int) -> np.ndarray:
+    """Greedy nearest-neighbor path over dist, starting from the given stop"""
+    n = dist.shape[0]
+    visited = np.zeros(n, dtype=np.bool_)
+    route = np.empty(n, dtype=np.int64)
+    route[0] = start
+    visited[start] = True
+    
+    for k in range(1, n):
+        # One masked scan per step, which also stays vectorized when numba is missing;
+        # argmin keeps the lowest index on ties
+        candidates = np.where(visited, np.inf, dist[route[k - 1]])
+        route[k] = int(np.argmin(candidates))
+        visited[route[k]] = True
+    
+    return route
+
+# nogil: routes optimized on worker threads run their sweeps on separate cores, which pays off far
+# better than splitting a single sweep with prange
+@njit(cache=True, fastmath=True, nogil=True)
+def _two_opt(route: np.ndarray, dist: np.ndarray, max_moves: int) -> Tuple[np.ndarray, int]:
+    """First-improvement 2-opt on the open path in place, returns (route, moves applied)"""
+    n = route.shape[0]
+    # Don't-look bits: a stop's bit is set once no move improves either of its edges, and only a
+    # move through that stretch of the path clears it again, so settled parts are not rescanned
+    dont_look = np.zeros(n, dtype=np.bool_)
+    moves = 0
+    active = True
+    
+    while active and moves < max_moves:
+        active = False
+        for k in range(1, n):
+            if dont_look[route[k]]:
+                continue
+            
+            improved = False
+            # Pair each edge at route[k] (edge e joins route[e-1] and route[e]) with every non-adjacent edge
+            for e in range(k, min(k + 2, n)):
+                for m in range(1, n):
+                    if abs(m - e) < 2:
+                        continue
+                    i = min(e, m)
+                    j = max(e, m)
+                    # Reversing route[i:j] only replaces edges (a,b) and (c,d) with (a,c) and (b,d)
+                    a = route[i - 1]
+                    b = route[i]
+                    c = route[j - 1]
+                    d = route[j]
+                    delta = (dist[a, c] + dist[b, d]) - (dist[a, b] + dist[c, d])
+                    
+                    if delta < -1e-10:
+                        route[i:j] = route[i:j][::-1].copy()
+                        # The reversed stretch counts as touched, its inner edges now run the other way
+                        dont_look[route[i - 1:j + 1]] = False
+                        moves += 1
+                        improved = True
+                        active = True
+                        break
+                if improved:
+                    break
+            
+            if not improved:
+                dont_look[route[k]] = True
+            elif moves >= max_moves:
+                break
+    
+    return route, moves
+
+
+class TokenBucket:
+    """Thread-safe token bucket: tokens refill at a steady rate up to capacity, each request takes one"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self, max_wait: float) -> bool:
+        """Take a token, sleeping until it is available, False if that would take longer than max_wait"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            if wait > max_wait:
+                return False
+            # The balance may go negative: that reserves the token and queues later callers behind this one
+            self._tokens -= 1
+        
+        if wait > 0:
+            logger.debug(f"Rate limiting: sleeping {wait:.1f}s")
+            time.sleep(wait)
+        return True
+
+
 class GeocodingCache:
     """Persistent geocoding cache using SQLite database"""
     
     def __init__(self, db_path: str = "geocoding_cache.db"):
         self.db_path = db_path
+        # Each thread opens its own connection on first use; the lock only queues this process's writers
+        self._local = threading.local()
+        self._lock = threading.Lock()
         self.init_database()
     
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """This thread's connection to the cache database"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.db_path)
+        return conn
+    
     def init_database(self):
         """Initialize the geocoding cache database"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Create table if it doesn't exist
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS geocoding_cache (
-                    address_hash TEXT PRIMARY KEY,
-                    full_address TEXT NOT NULL,
-                    latitude REAL NOT NULL,
-                    longitude REAL NOT NULL,
-                    success_count INTEGER DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Create index for faster lookups
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_address_hash ON geocoding_cache(address_hash)
-            ''')
-            
-            conn.commit()
-            conn.close()
+            with self._lock:
+                table = self._conn.execute(
+                    "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'geocoding_cache'").fetchone()
+                if table and 'WITHOUT ROWID' not in table[0].upper():
+                    self._migrate_rowid_table()
+                
+                # Create table if it doesn't exist
+                self._conn.execute(GEOCODE_TABLE_SQL)
+                
+                self._rehash_legacy_rows()
             
             # Log cache statistics
             cache_size = self.get_cache_size()
@@ -55,61 +321,131 @@ class GeocodingCache:
         except Exception as e:
             logger.error(f"Error initializing geocoding cache: {e}")
     
-    def _hash_address(self, address: str) -> str:
-        """Create a hash for the address to use as key"""
-        return hashlib.md5(address.lower().strip().encode()).hexdigest()
+    def _migrate_rowid_table(self):
+        """Rebuild the old rowid table, whose hash index needed a second lookup into the table, as WITHOUT ROWID"""
+        self._conn.execute('BEGIN')
+        try:
+            self._conn.execute('ALTER TABLE geocoding_cache RENAME TO geocoding_cache_rowid')
+            self._conn.execute(GEOCODE_TABLE_SQL)
+            self._conn.execute('''
+                INSERT OR REPLACE INTO geocoding_cache
+                    (address_hash, full_address, latitude, longitude, success_count, created_at, last_used)
+                SELECT address_hash, full_address, latitude, longitude, success_count, created_at, last_used
+                FROM geocoding_cache_rowid
+            ''')
+            # Dropping the old table also drops idx_address_hash, which the primary key already covers
+            self._conn.execute('DROP TABLE geocoding_cache_rowid')
+            self._conn.execute('COMMIT')
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        logger.info("Geocoding cache migrated to a WITHOUT ROWID table")
+    
+    def _rehash_legacy_rows(self):
+        """Re-key rows stored under the old MD5 hex digests, which are text rather than blobs"""
+        rows = self._conn.execute(
+            "SELECT address_hash, full_address FROM geocoding_cache WHERE typeof(address_hash) = 'text'").fetchall()
+        if not rows:
+            return
+        
+        self._conn.execute('BEGIN')
+        try:
+            self._conn.executemany("UPDATE OR REPLACE geocoding_cache SET address_hash = ? WHERE address_hash = ?",
+                                   [(_hash_address(full_address), old_hash) for old_hash, full_address in rows])
+            self._conn.execute('COMMIT')
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        logger.info(f"Re-keyed {len(rows)} cached addresses")
     
     def get_coordinates(self, address: str) -> Optional[Tuple[float, float]]:
         """Get coordinates from cache"""
         try:
-            address_hash = self._hash_address(address)
-            
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT latitude, longitude FROM geocoding_cache 
-                WHERE address_hash = ?
-            ''', (address_hash,))
-            
-            result = cursor.fetchone()
+            address_hash = _hash_address(address)
+            
+            with self._lock:
+                if SQLITE_RETURNING:
+                    # fetchall() runs the statement to completion so its write transaction ends here
+                    rows = self._conn.execute(GEOCODE_FETCH_SQL, (address_hash,)).fetchall()
+                    result = rows[0] if rows else None
+                else:
+                    result = self._conn.execute(GEOCODE_SELECT_SQL, (address_hash,)).fetchone()
+                    
+                    if result:
+                        # Update last_used timestamp and success_count
+                        self._conn.execute(GEOCODE_TOUCH_SQL, (address_hash,))
             
             if result:
-                # Update last_used timestamp and success_count
-                cursor.execute('''
-                    UPDATE geocoding_cache 
-                    SET last_used = CURRENT_TIMESTAMP, success_count = success_count + 1
-                    WHERE address_hash = ?
-                ''', (address_hash,))
-                conn.commit()
-                
                 logger.debug(f"Cache hit for: {address[:50]}...")
-                return (result[0], result[1])
+                return (float(result[0]), float(result[1]))
             
-            conn.close()
             return None
             
         except Exception as e:
             logger.error(f"Error reading from geocoding cache: {e}")
             return None
     
+    def get_many(self, addresses: List[str]) -> Dict[str, Tuple[float, float]]:
+        """Get cached coordinates for many addresses with one IN (...) query per batch of keys"""
+        hashes = {}
+        for address in addresses:
+            hashes.setdefault(_hash_address(address), []).append(address)
+        
+        found = {}
+        try:
+            keys = list(hashes)
+            with self._lock:
+                for start in range(0, len(keys), SQLITE_BATCH_SIZE):
+                    batch = keys[start:start + SQLITE_BATCH_SIZE]
+                    placeholders = ','.join('?' * len(batch))
+                    if SQLITE_RETURNING:
+                        rows = self._conn.execute(
+                            f"UPDATE geocoding_cache SET last_used = CURRENT_TIMESTAMP, success_count = success_count + 1 "
+                            f"WHERE address_hash IN ({placeholders}) RETURNING address_hash, latitude, longitude",
+                            batch).fetchall()
+                    else:
+                        rows = self._conn.execute(
+                            f"SELECT address_hash, latitude, longitude FROM geocoding_cache WHERE address_hash IN ({placeholders})",
+                            batch).fetchall()
+                        if rows:
+                            hit_hashes = [row[0] for row in rows]
+                            self._conn.execute(
+                                f"UPDATE geocoding_cache SET last_used = CURRENT_TIMESTAMP, success_count = success_count + 1 "
+                                f"WHERE address_hash IN ({','.join('?' * len(hit_hashes))})", hit_hashes)
+                    for address_hash, lat, lng in rows:
+                        for address in hashes[address_hash]:
+                            found[address] = (float(lat), float(lng))
+        except Exception as e:
+            logger.error(f"Error reading from geocoding cache: {e}")
+        
+        return found
+    
+    def store_many(self, rows: List[Tuple[str, float, float]]):
+        """Store many (address, lat, lng) rows in a single transaction"""
+        try:
+            params = [(_hash_address(address), address, lat, lng) for address, lat, lng in rows]
+            with self._lock:
+                self._conn.execute('BEGIN')
+                try:
+                    self._conn.executemany(GEOCODE_UPSERT_SQL, params)
+                    self._conn.execute('COMMIT')
+                except Exception:
+                    self._conn.execute('ROLLBACK')
+                    raise
+            
+            logger.debug(f"Cached coordinates for {len(params)} addresses")
+            
+        except Exception as e:
+            logger.error(f"Error storing in geocoding cache: {e}")
+    
     def store_coordinates(self, address: str, lat: float, lng: float):
         """Store coordinates in cache"""
         try:
-            address_hash = self._hash_address(address)
-            
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            address_hash = _hash_address(address)
             
             # Insert or update
-            cursor.execute('''
-                INSERT OR REPLACE INTO geocoding_cache 
-                (address_hash, full_address, latitude, longitude, created_at, last_used)
-                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-            ''', (address_hash, address, lat, lng))
-            
-            conn.commit()
-            conn.close()
+            with self._lock:
+                self._conn.execute(GEOCODE_UPSERT_SQL, (address_hash, address, lat, lng))
             
             logger.debug(f"Cached coordinates for: {address[:50]}...")
             
@@ -119,11 +455,7 @@ class GeocodingCache:
     def get_cache_size(self) -> int:
         """Get number of cached addresses"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM geocoding_cache')
-            result = cursor.fetchone()
-            conn.close()
+            result = self._conn.execute('SELECT COUNT(*) FROM geocoding_cache').fetchone()
             return result[0] if result else 0
         except:
             return 0
@@ -131,11 +463,8 @@ class GeocodingCache:
     def get_cache_stats(self) -> Dict:
         """Get cache statistics"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             # Get basic stats
-            cursor.execute('''
+            result = self._conn.execute('''
                 SELECT 
                     COUNT(*) as total_addresses,
                     SUM(success_count) as total_hits,
@@ -143,10 +472,7 @@ class GeocodingCache:
                     MIN(created_at) as oldest_entry,
                     MAX(last_used) as most_recent_use
                 FROM geocoding_cache
-            ''')
-            
-            result = cursor.fetchone()
-            conn.close()
+            ''').fetchone()
             
             if result:
                 return {
@@ -168,109 +494,149 @@ class RoutingCache:
     
     def __init__(self, db_path: str = "routing_cache.db"):
         self.db_path = db_path
+        # Each thread opens its own connection on first use; the lock only queues this process's writers
+        self._local = threading.local()
+        self._lock = threading.Lock()
         self.init_database()
     
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """This thread's connection to the cache database"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.db_path)
+        return conn
+    
     def init_database(self):
         """Initialize the routing cache database"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Create table for routing cache
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS routing_cache (
-                    route_hash TEXT PRIMARY KEY,
-                    from_lat REAL NOT NULL,
-                    from_lng REAL NOT NULL,
-                    to_lat REAL NOT NULL,
-                    to_lng REAL NOT NULL,
-                    distance_km REAL NOT NULL,
-                    duration_minutes REAL NOT NULL,
-                    geometry TEXT,
-                    profile TEXT DEFAULT 'driving-car',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Add geometry column to existing tables if it doesn't exist
-            try:
-                cursor.execute('ALTER TABLE routing_cache ADD COLUMN geometry TEXT')
-            except sqlite3.OperationalError:
-                # Column already exists
-                pass
-            
-            # Create index for faster lookups
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_route_hash ON routing_cache(route_hash)
-            ''')
-            
-            conn.commit()
-            conn.close()
+            with self._lock:
+                columns = {row[1] for row in self._conn.execute('PRAGMA table_info(routing_cache)')}
+                if 'route_hash' in columns:
+                    self._migrate_hashed_table(columns)
+                
+                # Create table for routing cache
+                self._conn.execute(ROUTE_TABLE_SQL)
             
         except Exception as e:
             logger.error(f"Error initializing routing cache: {e}")
     
-    def _hash_route(self, from_coords: Tuple[float, float], to_coords: Tuple[float, float]) -> str:
-        """Create a hash for the route (always driving-car profile)"""
-        route_string = f"{from_coords[0]:.6f},{from_coords[1]:.6f}-{to_coords[0]:.6f},{to_coords[1]:.6f}-driving-car"
-        return hashlib.md5(route_string.encode()).hexdigest()
+    def _migrate_hashed_table(self, columns: set):
+        """Move rows from the old MD5-keyed table into the microdegree-keyed layout"""
+        geometry = 'geometry' if 'geometry' in columns else 'NULL'
+        self._conn.execute('BEGIN')
+        try:
+            self._conn.execute('ALTER TABLE routing_cache RENAME TO routing_cache_md5')
+            self._conn.execute(ROUTE_TABLE_SQL)
+            self._conn.execute(f'''
+                INSERT OR REPLACE INTO routing_cache
+                    ({ROUTE_KEY_COLUMNS}, distance_km, duration_minutes, geometry, profile, created_at, last_used)
+                SELECT CAST(ROUND(from_lat * 1e6) AS INTEGER), CAST(ROUND(from_lng * 1e6) AS INTEGER),
+                       CAST(ROUND(to_lat * 1e6) AS INTEGER), CAST(ROUND(to_lng * 1e6) AS INTEGER),
+                       distance_km, duration_minutes, {geometry}, profile, created_at, last_used
+                FROM routing_cache_md5
+            ''')
+            self._conn.execute('DROP TABLE routing_cache_md5')
+            self._conn.execute('COMMIT')
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        logger.info("Routing cache migrated to coordinate keys")
+    
+    def _route_key(self, from_coords: Tuple[float, float], to_coords: Tuple[float, float]) -> Tuple[int, int, int, int]:
+        """Key for the route (always driving-car profile): both endpoints in integer microdegrees"""
+        return (int(round(from_coords[0] * 1e6)), int(round(from_coords[1] * 1e6)),
+                int(round(to_coords[0] * 1e6)), int(round(to_coords[1] * 1e6)))
     
     def get_route(self, from_coords: Tuple[float, float], to_coords: Tuple[float, float]) -> Optional[Dict]:
         """Get route from cache"""
         try:
-            route_hash = self._hash_route(from_coords, to_coords)
-            
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT distance_km, duration_minutes, geometry FROM routing_cache 
-                WHERE route_hash = ?
-            ''', (route_hash,))
-            
-            result = cursor.fetchone()
+            route_key = self._route_key(from_coords, to_coords)
+            
+            with self._lock:
+                if SQLITE_RETURNING:
+                    rows = self._conn.execute(ROUTE_FETCH_SQL, route_key).fetchall()
+                    result = rows[0] if rows else None
+                else:
+                    result = self._conn.execute(ROUTE_SELECT_SQL, route_key).fetchone()
+                    
+                    if result:
+                        # Update last_used timestamp
+                        self._conn.execute(ROUTE_TOUCH_SQL, route_key)
             
             if result:
-                # Update last_used timestamp
-                cursor.execute('''
-                    UPDATE routing_cache 
-                    SET last_used = CURRENT_TIMESTAMP
-                    WHERE route_hash = ?
-                ''', (route_hash,))
-                conn.commit()
-                
                 return {
-                    'distance_km': result[0],
-                    'duration_minutes': result[1],
+                    'distance_km': float(result[0]),
+                    'duration_minutes': float(result[1]),
                     'geometry': result[2] if len(result) > 2 else None
                 }
             
-            conn.close()
             return None
             
         except Exception as e:
             logger.error(f"Error reading from routing cache: {e}")
             return None
     
+    def get_many(self, pairs: List[Tuple[Tuple[float, float], Tuple[float, float]]]) -> Dict[Tuple, Dict]:
+        """Get cached routes for many (from_coords, to_coords) pairs with one IN (...) query per batch of keys"""
+        route_keys = {}
+        for pair in pairs:
+            route_keys.setdefault(self._route_key(*pair), []).append(pair)
+        
+        found = {}
+        try:
+            keys = list(route_keys)
+            # Every key binds four parameters
+            batch_size = SQLITE_BATCH_SIZE // 4
+            with self._lock:
+                for start in range(0, len(keys), batch_size):
+                    batch = keys[start:start + batch_size]
+                    placeholders = ','.join(['(?, ?, ?, ?)'] * len(batch))
+                    # Row-value IN (...) would scan the table, joining from the key list searches the primary key
+                    rows = self._conn.execute(
+                        f"WITH keys({ROUTE_KEY_COLUMNS}) AS (VALUES {placeholders}) "
+                        f"SELECT {ROUTE_KEY_COLUMNS}, distance_km, duration_minutes, geometry "
+                        f"FROM keys CROSS JOIN routing_cache USING ({ROUTE_KEY_COLUMNS})",
+                        [value for key in batch for value in key]).fetchall()
+                    if rows:
+                        self._conn.executemany(ROUTE_TOUCH_SQL, [row[:4] for row in rows])
+                    for row in rows:
+                        for pair in route_keys[row[:4]]:
+                            found[pair] = {
+                                'distance_km': row[4],
+                                'duration_minutes': row[5],
+                                'geometry': row[6]
+                            }
+        except Exception as e:
+            logger.error(f"Error reading from routing cache: {e}")
+        
+        return found
+    
     def store_route(self, from_coords: Tuple[float, float], to_coords: Tuple[float, float], 
-                   distance_km: float, duration_minutes: float, geometry: str = None):
+                   distance_km: float, duration_minutes: float, geometry: bytes = None):
         """Store route in cache"""
         try:
-            route_hash = self._hash_route(from_coords, to_coords)
-            
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            route_key = self._route_key(from_coords, to_coords)
             
-            cursor.execute('''
-                INSERT OR REPLACE INTO routing_cache 
-                (route_hash, from_lat, from_lng, to_lat, to_lng, distance_km, duration_minutes, geometry, profile, created_at, last_used)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-            ''', (route_hash, from_coords[0], from_coords[1], to_coords[0], to_coords[1], 
-                  distance_km, duration_minutes, geometry, 'driving-car'))
+            with self._lock:
+                self._conn.execute(ROUTE_UPSERT_SQL, (*route_key, distance_km, duration_minutes, geometry, 'driving-car'))
             
-            conn.commit()
-            conn.close()
+        except Exception as e:
+            logger.error(f"Error storing in routing cache: {e}")
+    
+    def store_routes(self, rows: List[Tuple[Tuple[float, float], Tuple[float, float], float, float, Optional[bytes]]]):
+        """Store many (from_coords, to_coords, distance_km, duration_minutes, geometry) rows in a single transaction"""
+        try:
+            params = [(*self._route_key(from_coords, to_coords), distance_km, duration_minutes, geometry, 'driving-car')
+                      for from_coords, to_coords, distance_km, duration_minutes, geometry in rows]
+            with self._lock:
+                self._conn.execute('BEGIN')
+                try:
+                    self._conn.executemany(ROUTE_UPSERT_SQL, params)
+                    self._conn.execute('COMMIT')
+                except Exception:
+                    self._conn.execute('ROLLBACK')
+                    raise
             
         except Exception as e:
             logger.error(f"Error storing in routing cache: {e}")
@@ -278,11 +644,7 @@ class RoutingCache:
     def get_cache_size(self) -> int:
         """Get number of cached routes"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM routing_cache')
-            result = cursor.fetchone()
-            conn.close()
+            result = self._conn.execute('SELECT COUNT(*) FROM routing_cache').fetchone()
             return result[0] if result else 0
         except:
             return 0
@@ -290,11 +652,8 @@ class RoutingCache:
     def clear_cache(self):
         """Clear all cached routes"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM routing_cache')
-            conn.commit()
-            conn.close()
+            with self._lock:
+                self._conn.execute('DELETE FROM routing_cache')
             logger.info("Routing cache cleared successfully")
         except Exception as e:
             logger.error(f"Error clearing routing cache: {e}")
@@ -303,11 +662,8 @@ class RoutingCache:
     def get_cache_stats(self) -> Dict:
         """Get routing cache statistics"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             # Get basic stats
-            cursor.execute('''
+            result = self._conn.execute('''
                 SELECT 
                     COUNT(*) as total_routes,
                     MIN(created_at) as oldest_entry,
@@ -315,10 +671,7 @@ class RoutingCache:
                     AVG(distance_km) as avg_distance_km,
                     AVG(duration_minutes) as avg_duration_min
                 FROM routing_cache
-            ''')
-            
-            result = cursor.fetchone()
-            conn.close()
+            ''').fetchone()
             
             if result:
                 return {
@@ -341,19 +694,24 @@ class RouteOptimizer:
     def __init__(self, ors_api_key: str = None):
         # Initialize geocoder
         self.geocoder = Nominatim(user_agent="route_optimizer_app")
+        # Thread-safe pacing shared by every lookup, errors still reach geocode_address's handlers
+        self._geocode = RateLimiter(self.geocoder.geocode, min_delay_seconds=NOMINATIM_MIN_DELAY,
+                                    max_retries=0, swallow_exceptions=False)
         
         # Initialize persistent caches
         self.geocoding_cache = GeocodingCache()
         self.routing_cache = RoutingCache()
         
-        # In-memory cache for current session (faster access)
-        self.session_cache = {}
-        
         # Routing setup with rate limiting for free tier
         self.ors_client = None
         self.last_api_call = 0  # Track last API call for rate limiting
         self.api_calls_this_minute = 0  # Track calls per minute
         self.minute_start = 0  # Track when current minute started
+        self._api_calls_lock = threading.Lock()
+        self._ors_bucket = TokenBucket(ORS_REQUESTS_PER_MINUTE / 60.0, ORS_WORKERS)
+        # Driving distances differ by direction (one-way streets, turn restrictions). When set, road
+        # distances are looked up and fetched for one direction only and mirrored onto the other
+        self.symmetric_routing = False
         
         try:
             import openrouteservice
@@ -385,6 +743,13 @@ class RouteOptimizer:
         except Exception as e:
             logger.warning(f"OpenRouteService initialization failed: {e}. Using air distance only.")
         
+        # The client keeps one requests.Session (HTTP keep-alive) for all calls; size its connection pool
+        # so the concurrent ORS workers each reuse a connection instead of opening and discarding extras.
+        # Retries stay with the client, which already backs off on 429 and 5xx responses
+        session = getattr(self.ors_client, '_session', None)
+        if session is not None:
+            session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=ORS_WORKERS))
+        
         # German postal code to coordinate mapping (fallback)
         self.postal_coordinates = {
             '80': [48.1351, 11.5820],  # München center
@@ -400,42 +765,34 @@ class RouteOptimizer:
             '22': [53.5511, 9.9937],   # Hamburg
             '01': [51.0504, 13.7373],  # Dresden
         }
+        # The same table as an array indexed by the two-digit prefix, NaN rows for unknown prefixes
+        self._postal_lut = np.full((100, 2), np.nan)
+        for prefix, coords in self.postal_coordinates.items():
+            self._postal_lut[int(prefix)] = coords
     
     def geocode_address(self, street: str, postal_code: str, city: str) -> Tuple[float, float]:
         """Geocode full address using Nominatim service with persistent caching"""
-        # Create full address string
-        address_parts = []
-        if street and str(street).strip() and str(street).strip().lower() != 'nan':
-            address_parts.append(str(street).strip())
-        if postal_code and str(postal_code).strip():
-            address_parts.append(str(postal_code).strip())
-        if city and str(city).strip() and str(city).strip().lower() != 'nan':
-            address_parts.append(str(city).strip())
-        
-        full_address = ', '.join(address_parts) + ', Germany'
-        
-        # Check session cache first (fastest)
-        if full_address in self.session_cache:
-            return self.session_cache[full_address]
-        
-        # Check persistent cache
+        return self._geocode_address(street, postal_code, city)[0]
+    
+    def _geocode_address(self, street: str, postal_code: str, city: str) -> Tuple[Tuple[float, float], str]:
+        """geocode_address that also reports where the coordinates came from: 'cache', 'geocoder' or 'postal'"""
+        full_address = _full_address(street, postal_code, city)
+        
+        # Check persistent cache - its connection stays open, so hot rows come from SQLite's page cache
         cached_coords = self.geocoding_cache.get_coordinates(full_address)
         if cached_coords:
-            # Store in session cache for even faster access
-            self.session_cache[full_address] = cached_coords
             logger.info(f"Cache hit: {full_address[:50]}... -> {cached_coords}")
-            return cached_coords
+            return cached_coords, 'cache'
         
         try:
             # Try geocoding with full address
-            location = self.geocoder.geocode(full_address, timeout=10)
+            location = self._geocode(full_address, timeout=10)
             if location:
                 coords = (location.latitude, location.longitude)
-                # Store in both caches
-                self.session_cache[full_address] = coords
+                # Store in persistent cache
                 self.geocoding_cache.store_coordinates(full_address, coords[0], coords[1])
                 logger.info(f"Geocoded: {full_address} -> {coords}")
-                return coords
+                return coords, 'geocoder'
             
             # Fallback: try with just postal code and city
             if postal_code and city:
@@ -444,19 +801,21 @@ class RouteOptimizer:
                 # Check if fallback is cached
                 cached_fallback = self.geocoding_cache.get_coordinates(fallback_address)
                 if cached_fallback:
-                    self.session_cache[full_address] = cached_fallback
+                    # Remember it under the full address too, so the next lookup does not query Nominatim again
+                    self.geocoding_cache.store_coordinates(full_address, cached_fallback[0], cached_fallback[1])
                     logger.info(f"Cache hit (fallback): {fallback_address} -> {cached_fallback}")
-                    return cached_fallback
+                    return cached_fallback, 'geocoder'
                 
-                location = self.geocoder.geocode(fallback_address, timeout=10)
+                location = self._geocode(fallback_address, timeout=10)
                 if location:
                     coords = (location.latitude, location.longitude)
                     # Store both original and fallback address
-                    self.session_cache[full_address] = coords
-                    self.geocoding_cache.store_coordinates(full_address, coords[0], coords[1])
-                    self.geocoding_cache.store_coordinates(fallback_address, coords[0], coords[1])
+                    self.geocoding_cache.store_many([
+                        (full_address, coords[0], coords[1]),
+                        (fallback_address, coords[0], coords[1])
+                    ])
                     logger.info(f"Geocoded (fallback): {fallback_address} -> {coords}")
-                    return coords
+                    return coords, 'geocoder'
             
         except (GeocoderTimedOut, GeocoderServiceError) as e:
             logger.warning(f"Geocoding failed for {full_address}: {e}")
@@ -464,17 +823,17 @@ class RouteOptimizer:
             logger.error(f"Unexpected geocoding error for {full_address}: {e}")
         
         # Final fallback to postal code mapping
-        return self.get_coordinates_from_postal(postal_code, city)
+        return self.get_coordinates_from_postal(postal_code, city), 'postal'
     
     def get_coordinates_from_postal(self, postal_code: str, city: str = '') -> Tuple[float, float]:
         """Get approximate coordinates from postal code (fallback method)"""
         try:
             # Clean postal code
             postal = str(postal_code).strip()
-            if len(postal) >= 2:
-                prefix = postal[:2]
-                if prefix in self.postal_coordinates:
-                    base_coords = self.postal_coordinates[prefix]
+            prefix = postal[:2]
+            if len(prefix) == 2 and prefix.isascii() and prefix.isdigit():
+                base_coords = self._postal_lut[int(prefix)].tolist()
+                if base_coords[0] == base_coords[0]:  # NaN marks an unknown prefix
                     # Add some variation based on full postal code for more realistic distribution
                     if len(postal) >= 5:
                         variation = int(postal[2:5]) / 10000  # Small variation
@@ -501,14 +860,22 @@ class RouteOptimizer:
         # Try full address geocoding first
         return self.geocode_address(street, postal_code, city)
     
+    def get_coordinates_batch(self, addresses: List[Tuple[str, str, str]]) -> Dict[Tuple[str, str, str], Tuple[float, float]]:
+        """Get coordinates for many (street, postal_code, city) keys, geocoding each distinct key once"""
+        keys = list(dict.fromkeys(addresses))
+        if len(keys) <= 1:
+            return {key: self.geocode_address(*key) for key in keys}
+        
+        with ThreadPoolExecutor(max_workers=min(GEOCODE_WORKERS, len(keys))) as executor:
+            return dict(zip(keys, executor.map(lambda key: self.geocode_address(*key), keys)))
+    
     def get_cache_stats(self) -> Dict:
         """Get comprehensive caching statistics"""
         persistent_stats = self.geocoding_cache.get_cache_stats()
         
         stats = {
             'geocoding_cache': persistent_stats,
-            'session_cache_size': len(self.session_cache),
-            'total_unique_addresses': persistent_stats.get('total_addresses', 0) + len(self.session_cache),
+            'total_unique_addresses': persistent_stats.get('total_addresses', 0),
             'routing_enabled': self.ors_client is not None,
             'routing_profile': 'driving-car' if self.ors_client else None
         }
@@ -519,11 +886,6 @@ class RouteOptimizer:
         
         return stats
     
-    def clear_session_cache(self):
-        """Clear the current session cache"""
-        self.session_cache.clear()
-        logger.info("Session cache cleared")
-
     def clear_routing_cache(self):
         """Clear the persistent routing cache"""
         try:
@@ -533,25 +895,19 @@ class RouteOptimizer:
             raise
 
     def clear_all_caches(self):
-        """Clear session and routing caches only (keeps geocoding cache)"""
+        """Clear the routing cache only (keeps geocoding cache)"""
         try:
-            self.clear_session_cache()
             self.clear_routing_cache()
-            logger.info("Session and routing caches cleared successfully")
+            logger.info("Routing cache cleared successfully")
         except Exception as e:
             logger.error(f"Error clearing caches: {e}")
             raise
     
     def preload_cache_for_addresses(self, addresses: List[str]) -> Dict:
         """Preload cache for a list of addresses and return statistics"""
-        cache_hits = 0
-        cache_misses = 0
-        
-        for address in addresses:
-            if self.geocoding_cache.get_coordinates(address):
-                cache_hits += 1
-            else:
-                cache_misses += 1
+        cached = self.geocoding_cache.get_many(addresses)
+        cache_hits = sum(1 for address in addresses if address in cached)
+        cache_misses = len(addresses) - cache_hits
         
         return {
             'total_addresses': len(addresses),
@@ -571,9 +927,28 @@ class RouteOptimizer:
         # Fallback to air distance
         return self.calculate_air_distance(lat1, lon1, lat2, lon2)
     
+    def _reserve_api_call(self) -> bool:
+        """Wait for the next ORS request slot, False if none frees up within ORS_MAX_WAIT"""
+        if not self._ors_bucket.acquire(ORS_MAX_WAIT):
+            logger.debug(f"Rate limit reached ({self.api_calls_this_minute} calls this minute), using air distance fallback")
+            return False
+        
+        with self._api_calls_lock:
+            current_time = time.time()
+            current_minute = int(current_time // 60)
+            
+            # Reset counter if we're in a new minute
+            if current_minute != self.minute_start:
+                self.minute_start = current_minute
+                self.api_calls_this_minute = 0
+            
+            self.last_api_call = current_time
+            self.api_calls_this_minute += 1
+        return True
+    
     def calculate_road_distance(self, from_coords: Tuple[float, float], to_coords: Tuple[float, float]) -> Optional[float]:
         """Calculate actual road distance using OpenRouteService with rate limiting"""
-        # Check cache first
+        # Check persistent cache first
         cached_route = self.routing_cache.get_route(from_coords, to_coords)
         if cached_route:
             return cached_route['distance_km']
@@ -582,27 +957,9 @@ class RouteOptimizer:
         if not self.ors_client:
             return None
         
-        # Rate limiting for free tier (40 requests per minute)
-        current_time = time.time()
-        current_minute = int(current_time // 60)
-        
-        # Reset counter if we're in a new minute
-        if current_minute != self.minute_start:
-            self.minute_start = current_minute
-            self.api_calls_this_minute = 0
-        
-        # Check if we've hit the rate limit
-        if self.api_calls_this_minute >= 35:  # Keep some buffer below 40
-            logger.debug(f"Rate limit reached ({self.api_calls_this_minute}/35 calls this minute), using air distance fallback")
+        if not self._reserve_api_call():
             return None
         
-        # Ensure minimum 1.5 seconds between calls (40/min = 1.5s/call)
-        time_since_last_call = current_time - self.last_api_call
-        if time_since_last_call < 1.6:  # 1.6 seconds to be safe
-            sleep_time = 1.6 - time_since_last_call
-            logger.debug(f"Rate limiting: sleeping {sleep_time:.1f}s")
-            time.sleep(sleep_time)
-        
         try:
             # Call OpenRouteService API
             coordinates = [
@@ -610,9 +967,6 @@ class RouteOptimizer:
                 [to_coords[1], to_coords[0]]
             ]
             
-            self.last_api_call = time.time()
-            self.api_calls_this_minute += 1
-            
             routes = self.ors_client.directions(
                 coordinates=coordinates,
                 profile='driving-car',
@@ -628,8 +982,7 @@ class RouteOptimizer:
                 # Extract geometry (route path coordinates)
                 geometry = None
                 if 'geometry' in routes['features'][0]:
-                    import json
-                    geometry = json.dumps(routes['features'][0]['geometry'])
+                    geometry = encode_geometry(routes['features'][0]['geometry'])
                 
                 # Cache the result including geometry
                 self.routing_cache.store_route(from_coords, to_coords, distance_km, duration_minutes, geometry)
@@ -644,6 +997,141 @@ class RouteOptimizer:
             logger.debug(f"Road routing API call failed: {e}")
             return None
     
+    def calculate_road_matrix(self, coords: List[Tuple[float, float]]) -> np.ndarray:
+        """Road distances in km between all coordinates, NaN where no road route is known
+        
+        Pairs missing from the routing cache are fetched from the ORS matrix endpoint, one request
+        per block of up to ORS_MATRIX_CHUNK sources x destinations, instead of one directions call per pair.
+        """
+        n = len(coords)
+        road = np.full((n, n), np.nan)
+        np.fill_diagonal(road, 0.0)
+        
+        wanted = ~np.eye(n, dtype=bool)
+        if self.symmetric_routing:
+            wanted = np.triu(wanted)
+        pairs = np.argwhere(wanted).tolist()
+        
+        cached = self.routing_cache.get_many([(coords[i], coords[j]) for i, j in pairs])
+        missing = np.zeros((n, n), dtype=bool)
+        for i, j in pairs:
+            route = cached.get((coords[i], coords[j]))
+            if route:
+                road[i, j] = route['distance_km']
+            else:
+                missing[i, j] = True
+        
+        total_pairs = len(pairs)
+        routing_cache_hits = total_pairs - int(missing.sum())
+        
+        blocks = []
+        if self.ors_client:
+            for src_start in range(0, n, ORS_MATRIX_CHUNK):
+                for dst_start in range(0, n, ORS_MATRIX_CHUNK):
+                    block = missing[src_start:src_start + ORS_MATRIX_CHUNK, dst_start:dst_start + ORS_MATRIX_CHUNK]
+                    if block.any():
+                        blocks.append(((src_start + np.flatnonzero(block.any(axis=1))).tolist(),
+                                       (dst_start + np.flatnonzero(block.any(axis=0))).tolist()))
+        
+        def request_block(block):
+            sources, destinations = block
+            if not self._reserve_api_call():
+                return None
+            # Send only this block's locations (ORS uses [lng, lat] format), sources first
+            locations = [[coords[k][1], coords[k][0]] for k in sources + destinations]
+            try:
+                return self.ors_client.distance_matrix(
+                    locations=locations,
+                    profile='driving-car',
+                    sources=list(range(len(sources))),
+                    destinations=list(range(len(sources), len(locations))),
+                    metrics=['distance', 'duration']
+                )
+            except Exception as e:
+                logger.debug(f"Road matrix API call failed: {e}")
+                return None
+        
+        rows = []
+        for (sources, destinations), response in zip(blocks, self._map_ors_requests(request_block, blocks)):
+            if response is None:
+                continue
+            for a, i in enumerate(sources):
+                for b, j in enumerate(destinations):
+                    distance_m = response['distances'][a][b]
+                    duration_s = response['durations'][a][b]
+                    # Unroutable pairs come back as null and keep their air distance
+                    if missing[i, j] and distance_m is not None and duration_s is not None:
+                        road[i, j] = distance_m / 1000.0  # Convert m to km
+                        rows.append((coords[i], coords[j], road[i, j], duration_s / 60.0, None))
+        
+        # Matrix responses carry no geometry, fetch_route_geometries adds it for the legs that are displayed
+        if rows:
+            self.routing_cache.store_routes(rows)
+        
+        if self.symmetric_routing:
+            # Blocks below the diagonal were never requested, they take the mirrored distances
+            lower = np.tril_indices(n, -1)
+            road[lower] = road.T[lower]
+        
+        final_route_hit_rate = (routing_cache_hits / total_pairs) * 100 if total_pairs > 0 else 0
+        logger.info(f"Distance matrix complete: {routing_cache_hits} routing cache hits, {len(rows)} new routes "
+                    f"({final_route_hit_rate:.1f}% routing cache hit rate)")
+        return road
+    
+    def fetch_route_geometries(self, stops: List[Dict], route_orders: List[List[int]]):
+        """Cache road geometries for the legs of the given routes, one ORS directions request per ORS_DIRECTIONS_WAYPOINTS stops"""
+        if not self.ors_client:
+            return
+        
+        # Waypoint chunks of every route, sharing their last stop with the next chunk; identical chunks are requested once
+        step = ORS_DIRECTIONS_WAYPOINTS - 1
+        chunks = {}
+        for route_order in route_orders:
+            coords = [stops[k]['_coordinates'] for k in route_order]
+            for start in range(0, len(coords) - 1, step):
+                chunks.setdefault(tuple(coords[start:start + step + 1]), None)
+        
+        legs = [leg for waypoints in chunks for leg in zip(waypoints[:-1], waypoints[1:])]
+        cached = self.routing_cache.get_many(legs)
+        chunks = [waypoints for waypoints in chunks
+                  if not all(cached.get(leg, {}).get('geometry') for leg in zip(waypoints[:-1], waypoints[1:]))]
+        
+        def request_chunk(waypoints):
+            if not self._reserve_api_call():
+                return []
+            try:
+                routes = self.ors_client.directions(
+                    coordinates=[[lng, lat] for lat, lng in waypoints],
+                    profile='driving-car',
+                    format='geojson'
+                )
+                feature = routes['features'][0]
+                line = feature['geometry']['coordinates']
+                way_points = feature['properties']['way_points']
+                
+                # The response holds one line for the whole route, way_points mark where each leg starts
+                chunk_rows = []
+                for k, segment in enumerate(feature['properties']['segments']):
+                    geometry = {'type': 'LineString', 'coordinates': line[way_points[k]:way_points[k + 1] + 1]}
+                    chunk_rows.append((waypoints[k], waypoints[k + 1], segment['distance'] / 1000.0,
+                                       segment['duration'] / 60.0, encode_geometry(geometry)))
+                return chunk_rows
+            except Exception as e:
+                logger.debug(f"Road geometry API call failed: {e}")
+                return []
+        
+        rows = [row for chunk_rows in self._map_ors_requests(request_chunk, chunks) for row in chunk_rows]
+        if rows:
+            self.routing_cache.store_routes(rows)
+    
+    def _map_ors_requests(self, request, items: List) -> List:
+        """Run ORS requests on up to ORS_WORKERS threads, each one paced by _reserve_api_call"""
+        if len(items) <= 1:
+            return [request(item) for item in items]
+        
+        with ThreadPoolExecutor(max_workers=min(ORS_WORKERS, len(items))) as executor:
+            return list(executor.map(request, items))
+    
     def calculate_air_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
         """Calculate distance between two coordinates using Haversine formula (in km)"""
         R = 6371  # Earth's radius in km
@@ -664,10 +1152,32 @@ class RouteOptimizer:
     
     def get_route_segments(self, stops: List[Dict], route_order: List[int]) -> List[Dict]:
         """Get route segments with geometry for visualization"""
-        segments = []
-        
+        return self.get_route_segments_batch(stops, [route_order])[0]
+    
+    def get_route_segments_batch(self, stops: List[Dict], route_orders: List[List[int]]) -> List[List[Dict]]:
+        """Route segments for several orders of the same stops, looking up and decoding each distinct leg once"""
+        coords = stop_coordinates(stops)
+        legs = {(stops[order[i]]['_coordinates'], stops[order[i + 1]]['_coordinates'])
+                for order in route_orders for i in range(len(order) - 1)}
+        # Cached routes with geometry for every leg in one batched lookup
+        cached_routes = self.routing_cache.get_many(list(legs))
+        # Legs the orders share keep one decoded geometry
+        geometries = {}
+        
+        return [self._route_segments(stops, coords, order, cached_routes, geometries) for order in route_orders]
+    
+    def _route_segments(self, stops: List[Dict], coords: np.ndarray, route_order: List[int],
+                        cached_routes: Dict[Tuple, Dict], geometries: Dict[Tuple, Dict]) -> List[Dict]:
+        """Segments of one route order from already fetched cached routes"""
         if len(route_order) <= 1:
-            return segments
+            return []
+        
+        # One slot per leg, filled in place
+        segments = [None] * (len(route_order) - 1)
+        
+        # Air distances of all legs in one vectorized pass, used for legs without a cached road route
+        path = coords[route_order]
+        air_km = air_distances(path[:-1, 0], path[:-1, 1], path[1:, 0], path[1:, 1])
         
         for i in range(len(route_order) - 1):
             from_stop = stops[route_order[i]]
@@ -676,8 +1186,8 @@ class RouteOptimizer:
             from_coords = from_stop['_coordinates']
             to_coords = to_stop['_coordinates']
             
-            # Try to get cached route with geometry
-            cached_route = self.routing_cache.get_route(from_coords, to_coords)
+            leg = (from_coords, to_coords)
+            cached_route = cached_routes.get(leg)
             
             segment = {
                 'from': {
@@ -698,9 +1208,9 @@ class RouteOptimizer:
             if cached_route and cached_route.get('geometry'):
                 # Use actual road route geometry
                 try:
-                    import json
-                    geometry_data = json.loads(cached_route['geometry'])
-                    segment['geometry'] = geometry_data
+                    if leg not in geometries:
+                        geometries[leg] = decode_geometry(cached_route['geometry'])
+                    segment['geometry'] = geometries[leg]
                     segment['distance_km'] = cached_route['distance_km']
                     segment['type'] = 'road'
                 except:
@@ -709,9 +1219,7 @@ class RouteOptimizer:
             
             if segment['geometry'] is None:
                 # Use straight line for air distance
-                segment['distance_km'] = self.calculate_air_distance(
-                    from_coords[0], from_coords[1], to_coords[0], to_coords[1]
-                )
+                segment['distance_km'] = float(air_km[i])
                 # Create simple line geometry for air distance
                 segment['geometry'] = {
                     'type': 'LineString',
@@ -721,39 +1229,33 @@ class RouteOptimizer:
                     ]
                 }
             
-            segments.append(segment)
+            segments[i] = segment
         
         return segments
     
-    def create_distance_matrix(self, stops: List[Dict]) -> List[List[float]]:
+    def create_distance_matrix(self, stops: List[Dict]) -> np.ndarray:
         """Create distance matrix between all stops"""
         n = len(stops)
-        matrix = [[0.0] * n for _ in range(n)]
         
         # Pre-geocode all stops to show progress
         logger.info(f"Geocoding {n} stops...")
         
-        # Check cache hit rate first
-        cache_stats = self.get_cache_stats()
-        logger.info(f"Starting with {cache_stats['geocoding_cache']['total_addresses']} addresses in persistent cache")
+        # The cache size only feeds this log line, and counting it scans the whole cache table
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"Starting with {self.geocoding_cache.get_cache_size()} addresses in persistent cache")
         
         geocoded_count = 0
         cache_hits = 0
         
         for i, stop in enumerate(stops):
-            # Check if this address was already cached before geocoding
-            street = stop.get('street', '')
-            postal_code = stop.get('postal_code', '')
-            city = stop.get('city', '')
-            address_parts = [street, postal_code, city]
-            full_address = ', '.join([part for part in address_parts if part and str(part).strip()]) + ', Germany'
-            
-            was_cached = self.geocoding_cache.get_coordinates(full_address) is not None
-            
-            coords = self.get_coordinates(stop)
+            # One lookup both geocodes the stop and tells whether the persistent cache already had it
+            coords, source = self._geocode_address(stop.get('street', ''), stop.get('postal_code', ''),
+                                                   stop.get('city', ''))
             stop['_coordinates'] = coords  # Cache coordinates in stop data
+            # Approximate postal code coordinates are not cached, a later lookup may still find the address
+            stop['_approximate'] = source == 'postal'
             
-            if was_cached:
+            if source == 'cache':
                 cache_hits += 1
             
             geocoded_count = i + 1
@@ -771,114 +1273,54 @@ class RouteOptimizer:
         logger.info(f"Creating distance matrix using {routing_mode}...")
         
         total_pairs = n * (n - 1)  # n*(n-1) because we skip i==j
-        completed_pairs = 0
-        routing_cache_hits = 0
-        
-        for i in range(n):
-            for j in range(n):
-                if i != j:
-                    coords_i = stops[i]['_coordinates']
-                    coords_j = stops[j]['_coordinates']
-                    
-                    # Check if this route was cached (for road routing)
-                    if self.ors_client:
-                        cached_route = self.routing_cache.get_route(coords_i, coords_j)
-                        if cached_route:
-                            routing_cache_hits += 1
-                    
-                    distance = self.calculate_distance(coords_i[0], coords_i[1], coords_j[0], coords_j[1])
-                    matrix[i][j] = distance
-                    
-                    completed_pairs += 1
-                    
-                    # Progress logging for large matrices
-                    if completed_pairs % 50 == 0 or completed_pairs == total_pairs:
-                        if self.ors_client:
-                            route_hit_rate = (routing_cache_hits / completed_pairs) * 100
-                            logger.info(f"Distance matrix: {completed_pairs}/{total_pairs} routes calculated ({routing_cache_hits} cached, {route_hit_rate:.1f}% hit rate)")
-                        else:
-                            logger.info(f"Distance matrix: {completed_pairs}/{total_pairs} distances calculated")
+        
+        # Air distances for every pair in one vectorized pass - also the fallback for pairs without a road route
+        coords = stop_coordinates(stops)
+        matrix = haversine_matrix(coords[:, 0], coords[:, 1])
         
         if self.ors_client:
-            final_route_hit_rate = (routing_cache_hits / total_pairs) * 100 if total_pairs > 0 else 0
-            new_routes = total_pairs - routing_cache_hits
-            logger.info(f"Distance matrix complete: {routing_cache_hits} routing cache hits, {new_routes} new routes ({final_route_hit_rate:.1f}% routing cache hit rate)")
+            road = self.calculate_road_matrix([stop['_coordinates'] for stop in stops])
+            matrix = np.where(np.isnan(road), matrix, road)
         else:
             logger.info(f"Distance matrix complete: {total_pairs} air distances calculated")
         
         return matrix
     
-    def nearest_neighbor(self, distance_matrix: List[List[float]], start_index: int = 0) -> List[int]:
+    def nearest_neighbor(self, distance_matrix: np.ndarray, start_index: int = 0) -> List[int]:
         """Nearest Neighbor algorithm to find initial route"""
         n = len(distance_matrix)
         if n <= 1:
             return list(range(n))
         
-        unvisited = set(range(n))
-        route = [start_index]
-        unvisited.remove(start_index)
-        current = start_index
-        
-        while unvisited:
-            nearest = min(unvisited, key=lambda x: distance_matrix[current][x])
-            route.append(nearest)
-            unvisited.remove(nearest)
-            current = nearest
-        
-        return route
+        dist = np.ascontiguousarray(distance_matrix, dtype=np.float64)
+        return _nearest_neighbor(dist, start_index).tolist()
     
-    def calculate_route_distance(self, route: List[int], distance_matrix: List[List[float]]) -> float:
+    def calculate_route_distance(self, route: List[int], distance_matrix: np.ndarray) -> float:
         """Calculate total distance for a route"""
         if len(route) <= 1:
             return 0.0
         
-        total_distance = 0.0
-        for i in range(len(route) - 1):
-            total_distance += distance_matrix[route[i]][route[i + 1]]
+        if not isinstance(distance_matrix, np.ndarray):
+            # Nested lists from older callers, converting them would cost more than the walk
+            return float(sum(distance_matrix[a][b] for a, b in zip(route, route[1:])))
         
-        return total_distance
+        route = np.asarray(route)
+        return float(distance_matrix[route[:-1], route[1:]].sum())
     
-    def two_opt(self, route: List[int], distance_matrix: List[List[float]], 
+    def two_opt(self, route: List[int], distance_matrix: np.ndarray, 
                 max_iterations: int = 1000) -> Tuple[List[int], bool]:
         """2-Opt improvement algorithm"""
         if len(route) <= 3:
             return route, False
         
-        best_route = route.copy()
-        best_distance = self.calculate_route_distance(best_route, distance_matrix)
-        improved = False
-        iterations = 0
-        
-        while iterations < max_iterations:
-            current_improved = False
-            
-            for i in range(1, len(route) - 2):
-                for j in range(i + 1, len(route)):
-                    if j - i == 1:
-                        continue  # Skip adjacent edges
-                    
-                    # Create new route by reversing segment between i and j
-                    new_route = route[:i] + route[i:j][::-1] + route[j:]
-                    new_distance = self.calculate_route_distance(new_route, distance_matrix)
-                    
-                    if new_distance < best_distance:
-                        best_route = new_route.copy()
-                        best_distance = new_distance
-                        route = new_route.copy()
-                        improved = True
-                        current_improved = True
-                        break
-                
-                if current_improved:
-                    break
-            
-            if not current_improved:
-                break
-            
-            iterations += 1
+        # The kernels index into one C-contiguous float64 matrix, converted once for all passes;
+        # strided views would otherwise get their own, slower 'A'-layout specialization
+        dist = np.ascontiguousarray(distance_matrix, dtype=np.float64)
+        best_route, iterations = _two_opt(np.asarray(route, dtype=np.int64).copy(), dist, max_iterations)
+        improved = iterations > 0
         
         logger.info(f"2-Opt completed after {iterations} iterations, improved: {improved}")
-        return best_route, improved
+        return best_route.tolist(), improved
     
     def optimize_route(self, stops: List[Dict], algorithm: str = 'both') -> Dict:
         """
@@ -944,8 +1386,13 @@ class RouteOptimizer:
                    f"{processing_time:.3f}s")
         
         # Get route segments with geometry for visualization
-        original_segments = self.get_route_segments(stops, original_order)
-        optimized_segments = self.get_route_segments(stops, optimized_order)
+        self.fetch_route_geometries(stops, [original_order, optimized_order])
+        original_segments, optimized_segments = self.get_route_segments_batch(stops, [original_order, optimized_order])
+        
+        # Approximate stops, or air distance where road routing was expected, may give a different result on retry
+        fallback_used = any(stop['_approximate'] for stop in stops) or (
+            self.ors_client is not None
+            and any(segment['type'] == 'air' for segment in original_segments + optimized_segments))
         
         return {
             'original_order': original_order,
@@ -958,7 +1405,8 @@ class RouteOptimizer:
             'processing_time': round(processing_time, 3),
             'stops_count': len(stops),
             'original_segments': original_segments,
-            'optimized_segments': optimized_segments
+            'optimized_segments': optimized_segments,
+            'fallback_used': fallback_used
         }
     
     def optimize_multiple_routes(self, df: pd.DataFrame, route_column: str, 
@@ -979,50 +1427,70 @@ class RouteOptimizer:
         start_time = time.time()
         
         # Group by route
-        routes = df.groupby(route_column)
+        routes = df.groupby(route_column, observed=True)
         results = {}
         total_distance_saved = 0
         total_stops = 0
         
         logger.info(f"Optimizing {len(routes)} routes with {algorithm} algorithm")
         
+        # Resolve the stop fields' columns once, missing fields stay empty strings
+        stop_columns = {field: address_columns[field] for field in ('postal_code', 'city', 'street')
+                        if field in address_columns}
+        if len(df.columns) > 0:
+            stop_columns['customer'] = address_columns.get('customer', df.columns[0])
+        fields = list(stop_columns)
+        
+        route_stops = []
         for route_id, route_data in routes:
-            # Prepare stops data
+            # Prepare stops data - plain tuples rather than a Series per row
             stops = []
-            for _, row in route_data.iterrows():
-                stop = {
-                    'postal_code': str(row[address_columns['postal_code']]) if 'postal_code' in address_columns else '',
-                    'city': str(row[address_columns['city']]) if 'city' in address_columns else '',
-                    'street': str(row[address_columns['street']]) if 'street' in address_columns else '',
-                    'customer': str(row[address_columns.get('customer', route_data.columns[0])]) if len(route_data.columns) > 0 else '',
-                    'original_index': row.name
-                }
+            for index, *values in route_data[list(stop_columns.values())].itertuples(name=None):
+                stop = {'postal_code': '', 'city': '', 'street': '', 'customer': ''}
+                stop.update(zip(fields, map(str, values)))
+                stop['original_index'] = index
                 stops.append(stop)
-            
+            route_stops.append((route_id, stops))
+        
+        def optimize(item):
+            route_id, stops = item
             # Optimize this route
             if len(stops) > 1:  # Only optimize routes with multiple stops
                 route_result = self.optimize_route(stops, algorithm)
                 route_result['route_id'] = route_id
                 route_result['stops'] = stops
-                results[route_id] = route_result
-                
+                return route_result
+            
+            # Single stop route - no optimization needed, only its coordinates for the map
+            coords, source = self._geocode_address(stops[0]['street'], stops[0]['postal_code'], stops[0]['city'])
+            stops[0]['_coordinates'] = coords
+            stops[0]['_approximate'] = source == 'postal'
+            return {
+                'route_id': route_id,
+                'stops': stops,
+                'original_order': [0],
+                'optimized_order': [0],
+                'original_distance': 0.0,
+                'optimized_distance': 0.0,
+                'distance_saved': 0.0,
+                'improvement_pct': 0.0,
+                'algorithm_used': 'No optimization needed',
+                'processing_time': 0.0,
+                'stops_count': 1,
+                'fallback_used': stops[0]['_approximate']
+            }
+        
+        if len(route_stops) > 1:
+            with ThreadPoolExecutor(max_workers=min(ROUTE_WORKERS, len(route_stops))) as executor:
+                route_results = list(executor.map(optimize, route_stops))
+        else:
+            route_results = [optimize(item) for item in route_stops]
+        
+        for (route_id, stops), route_result in zip(route_stops, route_results):
+            results[route_id] = route_result
+            if len(stops) > 1:
                 total_distance_saved += route_result['distance_saved']
                 total_stops += route_result['stops_count']
-            else:
-                # Single stop route - no optimization needed
-                results[route_id] = {
-                    'route_id': route_id,
-                    'stops': stops,
-                    'original_order': [0],
-                    'optimized_order': [0],
-                    'original_distance': 0.0,
-                    'optimized_distance': 0.0,
-                    'distance_saved': 0.0,
-                    'improvement_pct': 0.0,
-                    'algorithm_used': 'No optimization needed',
-                    'processing_time': 0.0,
-                    'stops_count': 1
-                }
         
         processing_time = time.time() - start_time
         
@@ -1051,23 +1519,29 @@ class RouteOptimizer:
     def create_optimized_dataframe(self, original_df: pd.DataFrame, optimization_results: Dict,
                                  route_column: str) -> pd.DataFrame:
         """Create a new DataFrame with optimized stop order"""
-        optimized_rows = []
+        # Collect every route's rows in optimized order, then gather them from the frame in one go
+        ordered_index = []
+        original_numbers = []
+        optimized_numbers = []
         
-        for route_id, route_result in optimization_results['routes'].items():
-            route_data = original_df[original_df[route_column] == route_id].copy()
+        for route_result in optimization_results['routes'].values():
             optimized_order = route_result['optimized_order']
             stops = route_result['stops']
             
-            # Reorder according to optimization
-            for new_position, original_position in enumerate(optimized_order):
-                original_index = stops[original_position]['original_index']
-                row = route_data.loc[original_index].copy()
-                
-                # Add optimization metadata
-                row['Original_Stop_Number'] = original_position + 1
-                row['Optimized_Stop_Number'] = new_position + 1
-                row['Distance_To_Next_km'] = 0.0  # Will be calculated separately
-                
-                optimized_rows.append(row)
+            ordered_index.extend(stops[original_position]['original_index'] for original_position in optimized_order)
+            original_numbers.extend(original_position + 1 for original_position in optimized_order)
+            optimized_numbers.extend(range(1, len(optimized_order) + 1))
+        
+        if not ordered_index:
+            return pd.DataFrame()
+        
+        # Category columns (such as a categorical route column) come back as plain values, like the rows did
+        rows = original_df.loc[ordered_index]
+        optimized_df = rows.astype({col: object for col in rows.select_dtypes('category').columns})
+        
+        # Add optimization metadata
+        optimized_df['Original_Stop_Number'] = original_numbers
+        optimized_df['Optimized_Stop_Number'] = optimized_numbers
+        optimized_df['Distance_To_Next_km'] = 0.0  # Will be calculated separately
         
-        return pd.DataFrame(optimized_rows) 
\ No newline at end of file
+        return optimized_df 
\ No newline at end of file
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Tests for the Vercel API (api/index.py)
+"""
+
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from api import index as api_index
+
+
+def upload_csv(rows):
+    """POST semicolon separated rows to /upload, returns (status code, JSON body)"""
+    data = {'file': (BytesIO('\n'.join(rows).encode('utf-8')), 'routes.csv')}
+    response = api_index.app.test_client().post('/upload', data=data, content_type='multipart/form-data')
+    return response.status_code, response.get_json()
+
+
+def cached_address_row(route_id, address):
+    """CSV row for one of the embedded cache's addresses, so the upload needs no geocoding requests"""
+    street, postal_code, city, _ = address.split(', ')
+    return f"{route_id};{street};{postal_code};{city};Customer"
+
+
+def random_stops(seed, n):
+    """Coordinates of n random stops around Munich, as the upload path passes them in"""
+    rng = np.random.default_rng(seed)
+    return (48.0 + rng.random(n) * 0.5).astype(np.float32), (11.3 + rng.random(n) * 0.7).astype(np.float32)
+
+
+def best_two_opt_delta(route, D):
+    """Smallest length change of any single 2-opt move on the closed tour, with route[0] kept in place"""
+    n = len(route)
+    D = D.astype(np.float64)
+    best = 0.0
+    for i in range(1, n - 1):
+        for j in range(i + 1, n):
+            a, b, c, d = route[i - 1], route[i], route[j], route[(j + 1) % n]
+            if d != a:
+                best = min(best, (D[a, c] + D[b, d]) - (D[a, b] + D[c, d]))
+    return best
+
+
+def test_route_codes_sort_numeric_ids_numerically():
+    """Route ids are parsed as strings but must still sort 9 before 10"""
+    codes = api_index.route_codes(pd.Series(['10', '9', '10', None, '9'], dtype='string'))
+    assert codes.tolist() == [1, 0, 1, -1, 0]
+
+    # Ids that are not all numbers keep the string order
+    codes = api_index.route_codes(pd.Series(['9', 'x', '10'], dtype='string'))
+    assert codes.tolist() == [1, 2, 0]
+
+
+def test_validate_route_data_ignores_columns_that_are_part_of_a_pattern():
+    """Single letters such as 'a' (in 'planned trip') or 'o' (in 'post') are not route or address columns"""
+    validation = api_index.validate_route_data(pd.DataFrame(columns=['a', 'p', 'o', 'c']))
+
+    assert not validation['is_valid']
+    assert validation['route_column'] is None
+    assert validation['address_columns'] == {}
+
+
+def test_validate_route_data_prefers_earlier_patterns():
+    """The earliest pattern with a matching column wins, so 'Postal code' beats 'Post box'"""
+    validation = api_index.validate_route_data(
+        pd.DataFrame(columns=['Planned trip', 'Street', 'Post box', 'Postal code', 'City']))
+
+    assert validation['is_valid']
+    assert validation['route_column'] == 'Planned trip'
+    assert validation['address_columns'] == {'street': 'Street', 'postal_code': 'Postal code', 'city': 'City'}
+
+
+def test_upload_optimizes_lowest_numeric_route():
+    """With route ids 9 and 10 the main route is 9, as with the inferred dtypes before"""
+    addresses = list(api_index.GEOCODING_CACHE)[:16]
+    rows = ["Route;Street;Postal code;City;Name"]
+    rows += [cached_address_row(9, address) for address in addresses[:10]]
+    rows += [cached_address_row(10, address) for address in addresses[10:]]
+
+    status, result = upload_csv(rows)
+
+    assert status == 200
+    assert result['stats']['geocoding']['total_addresses'] == 10
+    assert len(result['optimized_route']) == 10
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_two_opt_kernels_reach_local_optimum(seed):
+    """Both 2-opt kernels return a permutation whose reported length is its tour length and which no single move improves"""
+    lats, lngs = random_stops(seed, 30)
+    D = api_index.haversine_matrix(lats, lngs)
+    start = api_index._nearest_neighbor(D)
+    start_distance = api_index._tour_distance(start, D)
+
+    # Candidate lists over all other stops, so the first-improvement kernel sees the full neighborhood
+    first_route, first_distance, _, _ = api_index._two_opt(start.copy(), D, api_index._neighbor_lists(D, 29), 1000)
+    best_route, best_distance, _, _ = api_index._two_opt_best(start, D, 1000)
+
+    for route, distance in ((first_route, first_distance), (best_route, best_distance)):
+        assert sorted(route.tolist()) == list(range(30))
+        assert distance == pytest.approx(api_index._tour_distance(route, D), rel=1e-5)
+        assert distance <= start_distance + 1e-6
+        assert best_two_opt_delta(route, D) >= -1e-6
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_optimize_route_order_with_and_without_numba(seed, monkeypatch):
+    """The compiled restarts and the NumPy fallback both keep stop 0 first and shorten the tour comparably"""
+    lats, lngs = random_stops(seed, 30)
+    D = api_index.haversine_matrix(lats, lngs)
+    original_distance = api_index._tour_distance(np.arange(30), D)
+
+    results = [api_index.optimize_route_order(lats, lngs)]
+    monkeypatch.setattr(api_index, 'NUMBA_AVAILABLE', False)
+    results.append(api_index.optimize_route_order(lats, lngs))
+
+    for route, distance_saved, total_distance in results:
+        assert sorted(route.tolist()) == list(range(30))
+        assert route[0] == 0
+        assert total_distance == pytest.approx(api_index._tour_distance(route, D), rel=1e-5)
+        assert distance_saved == pytest.approx(original_distance - total_distance, rel=1e-5)
+        assert distance_saved >= 0
+        assert best_two_opt_delta(route, D) >= -1e-6
+
+    # Different local searches end in different local optima, but of similar length
+    compiled_total, fallback_total = results[0][2], results[1][2]
+    assert fallback_total == pytest.approx(compiled_total, rel=0.1)
+
+
+def test_health_reports_embedded_addresses_separately():
+    """cached_addresses counts the embedded cache only, runtime lookups are reported under geocoding_cache"""
+    response = api_index.app.test_client().get('/health')
+    result = response.get_json()
+
+    assert response.status_code == 200
+    assert result['cached_addresses'] == len(api_index.GEOCODING_CACHE)
+    assert {'hits', 'misses', 'currsize', 'persisted_addresses'} <= set(result['geocoding_cache'])
+
+
+def test_two_opt_best_counts_applied_moves():
+    """The move count matches the passes that changed the tour, also when the last allowed pass finds nothing"""
+    lats, lngs = random_stops(0, 12)
+    D = api_index.haversine_matrix(lats, lngs)
+    start = np.arange(12, dtype=np.int64)
+
+    route, _, iterations, moves = api_index._two_opt_best(start, D, 1000)
+    assert moves == iterations - 1
+
+    # Allow exactly the passes needed, so the pass that finds no move is the last one permitted
+    max_iter = iterations / 12
+    _, _, capped_iterations, capped_moves = api_index._two_opt_best(start, D, max_iter)
+    assert capped_iterations == iterations
+    assert capped_moves == moves
+
+    # One pass fewer stops on a pass that still applied a move
+    _, _, _, cut_moves = api_index._two_opt_best(start, D, (iterations - 1) / 12)
+    assert cut_moves == iterations - 1
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Tests for the Flask app (app.py), with geocoding and routing kept offline
+"""
+
+import codecs
+import hashlib
+import os
+import threading
+import time
+from io import BytesIO
+
+import pytest
+
+import app
+from route_optimizer import GeocodingCache, RoutingCache
+
+
+class FakeLocation:
+    """Stand-in for a geopy location, placed deterministically around Munich by the address"""
+
+    def __init__(self, address):
+        digest = int(hashlib.md5(address.encode('utf-8')).hexdigest(), 16)
+        self.latitude = 48.0 + (digest % 1000) / 2000.0
+        self.longitude = 11.3 + (digest // 1000 % 1000) / 1500.0
+
+
+def fake_geocode(address, timeout=None):
+    """Nominatim stand-in: every address is found except those in the city 'Nowhere'"""
+    return None if 'Nowhere' in address else FakeLocation(address)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Test client whose optimizer geocodes offline, uses air distance and keeps its caches in tmp_path"""
+    monkeypatch.setattr(app.OPTIMIZER, '_geocode', fake_geocode)
+    monkeypatch.setattr(app.OPTIMIZER, 'ors_client', None)
+    monkeypatch.setattr(app.OPTIMIZER, 'geocoding_cache', GeocodingCache(str(tmp_path / 'geocoding_cache.db')))
+    monkeypatch.setattr(app.OPTIMIZER, 'routing_cache', RoutingCache(str(tmp_path / 'routing_cache.db')))
+    monkeypatch.setitem(app.app.config, 'RESULT_CACHE_FOLDER', str(tmp_path / 'result_cache'))
+    return app.app.test_client()
+
+
+def route_csv(city='Erding'):
+    """Semicolon separated upload with two routes, the first stop of route 1 in the given city"""
+    rows = [
+        "Route;Street;Postal code;City;Name",
+        f"1;Hauptstr. 40;85435;{city};Customer A",
+        "1;Am Römerbrunnen 10;85609;Aschheim;Customer B",
+        "1;Lange Zeile 5;85435;Erding;Customer C",
+        "2;Bahnhofstr. 1;85354;Freising;Customer D",
+        "2;Marktplatz 3;85354;Freising;Customer E",
+    ]
+    return ('\n'.join(rows) + '\n').encode('utf-8')
+
+
+def post_upload(client, content, filename='routes.csv', algorithm='both', query=''):
+    """POST a file to /upload, returns the response"""
+    data = {'file': (BytesIO(content), filename), 'algorithm': algorithm}
+    return client.post(f'/upload{query}', data=data, content_type='multipart/form-data')
+
+
+@pytest.fixture
+def processed(monkeypatch):
+    """Records each upload that is actually processed rather than served from the result cache"""
+    calls = []
+    process_upload = app.process_upload
+
+    def counting_process_upload(*args):
+        calls.append(args)
+        return process_upload(*args)
+
+    monkeypatch.setattr(app, 'process_upload', counting_process_upload)
+    return calls
+
+
+def cached_files():
+    """Names of the entries in the result cache folder"""
+    folder = app.app.config['RESULT_CACHE_FOLDER']
+    return sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+
+
+@pytest.fixture(params=['streaming', 'werkzeug'])
+def upload_parser(request, monkeypatch):
+    """Runs a test once with the streaming multipart parser (when installed) and once with Werkzeug's"""
+    if request.param == 'streaming':
+        if not app.STREAMING_UPLOAD_AVAILABLE:
+            pytest.skip('streaming_form_data is not installed')
+    else:
+        monkeypatch.setattr(app, 'STREAMING_UPLOAD_AVAILABLE', False)
+    return request.param
+
+
+def test_async_upload_is_polled_and_collected_once(client, monkeypatch):
+    """A queued upload reports pending until it finishes, then hands out its result once"""
+    release = threading.Event()
+    process_upload = app.process_upload
+
+    def blocked_process_upload(*args):
+        release.wait(10)
+        return process_upload(*args)
+
+    monkeypatch.setattr(app, 'process_upload', blocked_process_upload)
+
+    response = post_upload(client, route_csv(), query='?async=1')
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+
+    response = client.get(f'/jobs/{job_id}')
+    assert response.status_code == 202
+    assert response.get_json()['status'] in ('pending', 'running')
+
+    release.set()
+    for _ in range(200):
+        response = client.get(f'/jobs/{job_id}')
+        if response.status_code != 202:
+            break
+        time.sleep(0.05)
+
+    assert response.status_code == 200
+    assert response.get_json()['stats']['optimization']['completed']
+    assert client.get(f'/jobs/{job_id}').status_code == 404
+
+
+def test_unknown_job_is_not_found(client):
+    """Job ids that were never handed out get a 404"""
+    assert client.get('/jobs/0123456789abcdef0123456789abcdef').status_code == 404
+
+
+def test_submit_evicts_stale_finished_jobs(client, monkeypatch):
+    """Finished jobs older than UPLOAD_JOB_MAX_AGE are dropped on the next submit, running ones are kept"""
+    finished = app.UPLOAD_EXECUTOR.submit(lambda: None)
+    finished.result()
+    release = threading.Event()
+    running = app.UPLOAD_EXECUTOR.submit(release.wait, 10)
+    stale = time.time() - app.UPLOAD_JOB_MAX_AGE - 1
+    monkeypatch.setitem(app.UPLOAD_JOBS, 'stale-finished', (finished, stale))
+    monkeypatch.setitem(app.UPLOAD_JOBS, 'stale-running', (running, stale))
+
+    try:
+        response = post_upload(client, route_csv(), query='?async=1')
+        assert response.status_code == 202
+        job_id = response.get_json()['job_id']
+
+        assert 'stale-finished' not in app.UPLOAD_JOBS
+        assert 'stale-running' in app.UPLOAD_JOBS
+        assert job_id in app.UPLOAD_JOBS
+    finally:
+        release.set()
+    # Let the job finish while the offline geocoder is still in place
+    app.UPLOAD_JOBS.pop(job_id)[0].result(timeout=30)
+
+
+def test_identical_upload_is_served_from_result_cache(client, processed):
+    """The same file with the same algorithm is processed once, a second upload gets the stored response"""
+    first = post_upload(client, route_csv())
+    second = post_upload(client, route_csv(), filename='renamed.csv')
+
+    assert first.status_code == second.status_code == 200
+    assert len(processed) == 1
+    assert cached_files() == [f"{app.result_cache_key(route_csv(), 'both')}.json"]
+    assert second.get_json()['stats']['filename'] == 'renamed.csv'
+    assert (second.get_json()['stats']['optimization']['summary']
+            == first.get_json()['stats']['optimization']['summary'])
+
+
+def test_other_algorithm_is_a_result_cache_miss(client, processed):
+    """The algorithm is part of the cache key"""
+    post_upload(client, route_csv(), algorithm='both')
+    post_upload(client, route_csv(), algorithm='nearest_neighbor')
+
+    assert len(processed) == 2
+    assert len(cached_files()) == 2
+
+
+def test_results_with_fallback_coordinates_are_not_cached(client, processed):
+    """A stop placed by the postal code table may be found on retry, so its upload is not stored"""
+    first = post_upload(client, route_csv(city='Nowhere'))
+    post_upload(client, route_csv(city='Nowhere'))
+
+    assert first.get_json()['stats']['optimization']['completed']
+    assert len(processed) == 2
+    assert cached_files() == []
+
+
+def test_expired_results_are_processed_again(client, processed):
+    """Entries older than RESULT_CACHE_MAX_AGE are ignored"""
+    post_upload(client, route_csv())
+    path = os.path.join(app.app.config['RESULT_CACHE_FOLDER'], cached_files()[0])
+    expired = time.time() - app.RESULT_CACHE_MAX_AGE - 1
+    os.utime(path, (expired, expired))
+
+    post_upload(client, route_csv())
+
+    assert len(processed) == 2
+
+
+def test_zero_max_age_disables_result_cache(client, processed, monkeypatch):
+    """RESULT_CACHE_MAX_AGE = 0 turns the result cache off"""
+    monkeypatch.setattr(app, 'RESULT_CACHE_MAX_AGE', 0)
+
+    post_upload(client, route_csv())
+    post_upload(client, route_csv())
+
+    assert len(processed) == 2
+    assert cached_files() == []
+
+
+@pytest.mark.parametrize('endpoint', ['/cache/clear/routing', '/cache/clear/all'])
+def test_clearing_caches_drops_cached_results(client, processed, endpoint):
+    """Cached responses hold distances from the routing cache, so both clear endpoints remove them"""
+    post_upload(client, route_csv())
+    assert len(cached_files()) == 1
+
+    assert client.post(endpoint).get_json()['success']
+    assert cached_files() == []
+
+    post_upload(client, route_csv())
+    assert len(processed) == 2
+
+
+def test_paginated_upload_serves_routes_separately(client):
+    """?paginate=1 sends the summary and route ids, each route's details come from /routes/<upload_id>/<route_id>"""
+    response = post_upload(client, route_csv(), query='?paginate=1')
+    optimization = response.get_json()['stats']['optimization']
+
+    assert response.status_code == 200
+    assert optimization['paginated']
+    assert 'route_comparisons' not in optimization and 'optimized_data' not in optimization
+    assert optimization['route_ids'] == [1, 2]
+    assert optimization['upload_id'] == app.result_cache_key(route_csv(), 'both')
+
+    response = client.get(f"/routes/{optimization['upload_id']}/1")
+    details = response.get_json()
+
+    assert response.status_code == 200
+    assert details['route_comparison']['route_id'] == 1
+    assert details['route_comparison']['stops_count'] == 3
+    assert len(details['optimized_data']) == 3
+    assert {str(row['Route']) for row in details['optimized_data']} == {'1'}
+
+
+def test_route_details_for_unknown_upload_or_route(client):
+    """Unknown, malformed or expired upload ids and unknown routes get a 404"""
+    upload_id = post_upload(client, route_csv(), query='?paginate=1').get_json()['stats']['optimization']['upload_id']
+
+    assert client.get(f'/routes/{upload_id}/3').status_code == 404
+    assert client.get('/routes/0123456789abcdef0123456789abcdef/1').status_code == 404
+    assert client.get('/routes/not-an-id/1').status_code == 404
+
+
+def test_paginate_sends_full_payload_when_result_is_not_cached(client):
+    """Uploads that are not cached cannot be paged, so they come in full and say so"""
+    response = post_upload(client, route_csv(city='Nowhere'), query='?paginate=1')
+    optimization = response.get_json()['stats']['optimization']
+
+    assert response.status_code == 200
+    assert optimization['paginated'] is False
+    assert 'upload_id' not in optimization
+    assert len(optimization['route_comparisons']) == 2
+
+
+def test_paginate_sends_full_payload_when_cache_write_fails(client, monkeypatch):
+    """An upload id is only handed out once the result is stored"""
+    monkeypatch.setattr(app, 'store_cached_result', lambda key, result: False)
+
+    optimization = post_upload(client, route_csv(), query='?paginate=1').get_json()['stats']['optimization']
+
+    assert optimization['paginated'] is False
+    assert 'upload_id' not in optimization
+    assert len(optimization['route_comparisons']) == 2
+
+
+@pytest.mark.parametrize('filename, error', [
+    (None, 'No file provided'),
+    ('', 'No file selected'),
+    ('routes.txt', 'Only CSV files are allowed'),
+])
+def test_upload_rejects_missing_or_wrong_files(client, upload_parser, filename, error):
+    """Both multipart parsers report a missing file, an empty filename and a non-CSV extension alike"""
+    data = {'algorithm': 'both'}
+    if filename is not None:
+        data['file'] = (BytesIO(route_csv()), filename)
+    response = client.post('/upload', data=data, content_type='multipart/form-data')
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == error
+
+
+def test_upload_reads_file_and_algorithm(client, upload_parser, monkeypatch):
+    """Both multipart parsers hand the file content, its name and the algorithm field to the processing"""
+    calls = []
+    streamed = []
+    stream_upload = app.stream_upload
+
+    def recording_process_upload(*args):
+        calls.append(args)
+        return {'stats': {}}, None
+
+    def recording_stream_upload():
+        streamed.append(True)
+        return stream_upload()
+
+    monkeypatch.setattr(app, 'process_upload', recording_process_upload)
+    monkeypatch.setattr(app, 'stream_upload', recording_stream_upload)
+
+    response = post_upload(client, route_csv(), filename='my routes.csv', algorithm='2_opt')
+
+    assert response.status_code == 200
+    assert calls == [(route_csv(), 'my_routes.csv', '2_opt', app.result_cache_key(route_csv(), '2_opt'))]
+    assert bool(streamed) == (upload_parser == 'streaming')
+
+
+def german_rows(separator):
+    """Header and two rows with umlauts and a comma inside a street field"""
+    rows = [['Tour', 'Straße', 'PLZ', 'Ort'],
+            ['T1', 'Hauptstr. 40, Hinterhaus', '85643', 'Steinhöring'],
+            ['T1', 'Am Römerbrunnen 10', '85609', 'Aschheim']]
+    return '\n'.join(separator.join(row) for row in rows) + '\n'
+
+
+def assert_german_frame(df):
+    """The frame read from german_rows, whatever the separator and encoding"""
+    assert list(df.columns) == ['Tour', 'Straße', 'PLZ', 'Ort']
+    assert df['Straße'].tolist() == ['Hauptstr. 40, Hinterhaus', 'Am Römerbrunnen 10']
+    assert df['Ort'].tolist() == ['Steinhöring', 'Aschheim']
+
+
+@pytest.mark.parametrize('separator', [';', '\t'])
+def test_read_csv_sniffs_separator(separator):
+    """Semicolon and tab files are read with their own separator even though fields contain commas"""
+    df, config = app.read_csv_content(german_rows(separator).encode('utf-8'))
+
+    assert_german_frame(df)
+    assert config == f"separator='{separator}', encoding='utf-8'"
+
+
+def test_read_csv_utf8_with_bom():
+    """The UTF-8 byte order mark does not end up in the first column name"""
+    raw = codecs.BOM_UTF8 + german_rows(';').encode('utf-8')
+
+    assert app.detect_encodings(raw) == ['utf-8']
+    assert_german_frame(app.read_csv_content(raw)[0])
+
+
+def test_read_csv_utf16_with_bom():
+    """Exports from Excel's 'Unicode text' are UTF-16 with a byte order mark"""
+    raw = german_rows('\t').encode('utf-16')
+
+    assert app.detect_encodings(raw) == ['utf-16']
+    df, config = app.read_csv_content(raw)
+    assert_german_frame(df)
+    assert config == "separator='\t', encoding='utf-16'"
+
+
+def test_read_csv_latin1_file():
+    """A head that is not valid UTF-8 goes straight to the latin-1 fallback"""
+    raw = german_rows(';').encode('latin-1')
+
+    assert app.detect_encodings(raw) == ['latin-1']
+    assert_german_frame(app.read_csv_content(raw)[0])
+
+
+def test_read_csv_falls_back_to_latin1_after_valid_utf8_head():
+    """Bytes that are invalid UTF-8 only after the sniffed head still fall back to latin-1"""
+    filler = ''.join(f"T1;Weg {i};85435;Erding\n" for i in range(app.CSV_SNIFF_BYTES // 20))
+    raw = (b'Tour;Strasse;PLZ;Ort\n' + filler.encode('ascii')
+           + 'T2;Römerstraße 1;85609;Aschheim\n'.encode('latin-1'))
+    assert raw[:app.CSV_SNIFF_BYTES].decode('utf-8')
+
+    assert app.detect_encodings(raw) == ['utf-8', 'latin-1']
+    df, config = app.read_csv_content(raw)
+    assert config == "separator=';', encoding='latin-1'"
+    assert df.iloc[-1].tolist() == ['T2', 'Römerstraße 1', 85609, 'Aschheim']
+
+
+def test_read_csv_without_columns_fails():
+    """A file that no separator splits into columns is rejected"""
+    assert app.read_csv_content(b'onlyonecolumn\n1\n2\n') == (None, None)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Tests for the SQLite caches in route_optimizer.py
+"""
+
+import hashlib
+import json
+import sqlite3
+
+import pytest
+
+from route_optimizer import GeocodingCache, RoutingCache, decode_geometry, encode_geometry
+
+
+def create_baseline_geocoding_db(db_path, rows):
+    """Geocoding cache in the original layout: MD5 hex keys in a rowid table with a separate hash index"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        CREATE TABLE geocoding_cache (
+            address_hash TEXT PRIMARY KEY,
+            full_address TEXT NOT NULL,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            success_count INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_address_hash ON geocoding_cache(address_hash)')
+    conn.executemany('INSERT INTO geocoding_cache (address_hash, full_address, latitude, longitude) VALUES (?, ?, ?, ?)',
+                     [(hashlib.md5(address.lower().strip().encode()).hexdigest(), address, lat, lng)
+                      for address, lat, lng in rows])
+    conn.commit()
+    conn.close()
+
+
+def create_baseline_routing_db(db_path, rows):
+    """Routing cache in the original layout: MD5 hex route keys and JSON text geometry"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        CREATE TABLE routing_cache (
+            route_hash TEXT PRIMARY KEY,
+            from_lat REAL NOT NULL,
+            from_lng REAL NOT NULL,
+            to_lat REAL NOT NULL,
+            to_lng REAL NOT NULL,
+            distance_km REAL NOT NULL,
+            duration_minutes REAL NOT NULL,
+            geometry TEXT,
+            profile TEXT DEFAULT 'driving-car',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_route_hash ON routing_cache(route_hash)')
+    for from_coords, to_coords, distance_km, duration_minutes, geometry in rows:
+        route_string = f"{from_coords[0]:.6f},{from_coords[1]:.6f}-{to_coords[0]:.6f},{to_coords[1]:.6f}-driving-car"
+        conn.execute('''
+            INSERT INTO routing_cache (route_hash, from_lat, from_lng, to_lat, to_lng, distance_km, duration_minutes, geometry)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (hashlib.md5(route_string.encode()).hexdigest(), *from_coords, *to_coords,
+              distance_km, duration_minutes, json.dumps(geometry) if geometry else None))
+    conn.commit()
+    conn.close()
+
+
+def table_sql(db_path, table):
+    """CREATE statement of a table as stored in sqlite_master"""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_geocoding_cache_migrates_baseline_database(tmp_path):
+    """Rows cached under MD5 hex keys in the rowid table are still found after the migration"""
+    db_path = str(tmp_path / 'geocoding_cache.db')
+    create_baseline_geocoding_db(db_path, [
+        ('Hauptstr. 40, 85643, Steinhöring, Germany', 48.0867, 12.0331),
+        ('Am Römerbrunnen 10, 85609, Aschheim, Germany', 48.1712, 11.7164),
+    ])
+
+    cache = GeocodingCache(db_path)
+
+    assert 'WITHOUT ROWID' in table_sql(db_path, 'geocoding_cache').upper()
+    assert cache.get_cache_size() == 2
+    # Keys are normalized like the MD5 ones were, so case and surrounding whitespace still do not matter
+    assert cache.get_coordinates(' hauptstr. 40, 85643, steinhöring, germany ') == (48.0867, 12.0331)
+    assert cache.get_many([
+        'Am Römerbrunnen 10, 85609, Aschheim, Germany',
+        'Unknown 1, 80331, München, Germany',
+    ]) == {'Am Römerbrunnen 10, 85609, Aschheim, Germany': (48.1712, 11.7164)}
+
+    # Reopening the migrated database leaves it as it is
+    assert GeocodingCache(db_path).get_coordinates('Hauptstr. 40, 85643, Steinhöring, Germany') == (48.0867, 12.0331)
+
+
+def test_routing_cache_migrates_baseline_database(tmp_path):
+    """Routes cached under MD5 hex keys are found by their endpoints, JSON geometry still decodes"""
+    db_path = str(tmp_path / 'routing_cache.db')
+    geometry = {'type': 'LineString', 'coordinates': [[12.0331, 48.0867], [11.9, 48.12], [11.7164, 48.1712]]}
+    create_baseline_routing_db(db_path, [
+        ((48.0867, 12.0331), (48.1712, 11.7164), 27.4, 31.5, geometry),
+        ((48.1712, 11.7164), (48.0867, 12.0331), 28.1, 32.0, None),
+    ])
+
+    cache = RoutingCache(db_path)
+
+    assert 'route_hash' not in table_sql(db_path, 'routing_cache')
+    assert cache.get_cache_size() == 2
+
+    route = cache.get_route((48.0867, 12.0331), (48.1712, 11.7164))
+    assert route['distance_km'] == 27.4
+    assert route['duration_minutes'] == 31.5
+    assert decode_geometry(route['geometry']) == geometry
+
+    reverse = cache.get_route((48.1712, 11.7164), (48.0867, 12.0331))
+    assert reverse['distance_km'] == 28.1
+    assert reverse['geometry'] is None
+
+    assert cache.get_route((48.0, 11.0), (48.1, 11.1)) is None
+
+
+@pytest.mark.parametrize('coordinates', [
+    [],
+    [[11.576124, 48.137154]],
+    [[12.0331, 48.0867], [11.9, 48.12], [11.7164, 48.1712]],
+    [[-73.985656, 40.748433], [-0.127758, 51.507351], [151.209296, -33.86882], [-179.999999, -89.999999]],
+])
+def test_geometry_round_trip(coordinates):
+    """Encoded geometries decode to the same [lng, lat] pairs at microdegree precision"""
+    decoded = decode_geometry(encode_geometry({'type': 'LineString', 'coordinates': coordinates}))
+
+    assert decoded['type'] == 'LineString'
+    assert len(decoded['coordinates']) == len(coordinates)
+    for (lng, lat), (expected_lng, expected_lat) in zip(decoded['coordinates'], coordinates):
+        assert lng == pytest.approx(expected_lng, abs=1e-6)
+        assert lat == pytest.approx(expected_lat, abs=1e-6)
+
+
+def test_geometry_drops_elevation():
+    """A third coordinate, as ORS returns with elevation, is not kept"""
+    coordinates = [[12.0331, 48.0867, 512.3], [11.7164, 48.1712, 498.0]]
+    decoded = decode_geometry(encode_geometry({'type': 'LineString', 'coordinates': coordinates}))
+
+    assert decoded['coordinates'] == [[12.0331, 48.0867], [11.7164, 48.1712]]
+
+
+def test_geometry_decodes_legacy_json_text():
+    """Rows cached before the binary encoding hold GeoJSON text, which decodes unchanged"""
+    geometry = {'type': 'LineString', 'coordinates': [[12.0331, 48.0867, 512.3], [-0.5, -10.25]]}
+
+    assert decode_geometry(json.dumps(geometry)) == geometry
+
+
+def test_routing_cache_stores_encoded_geometry(tmp_path):
+    """A route stored with an encoded geometry comes back as bytes that decode to the same line"""
+    cache = RoutingCache(str(tmp_path / 'routing_cache.db'))
+    coordinates = [[12.0331, 48.0867], [11.9, 48.12], [11.7164, 48.1712]]
+    cache.store_route((48.0867, 12.0331), (48.1712, 11.7164), 27.4, 31.5,
+                      encode_geometry({'type': 'LineString', 'coordinates': coordinates}))
+
+    route = cache.get_route((48.0867, 12.0331), (48.1712, 11.7164))
+
+    assert isinstance(route['geometry'], bytes)
+    assert decode_geometry(route['geometry'])['coordinates'] == coordinates
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Tests for the route kernels in route_optimizer.py, compiled and as plain Python
+"""
+
+import importlib.util
+import sys
+
+import numpy as np
+import pytest
+
+import route_optimizer
+from route_optimizer import haversine_matrix
+
+
+def random_distances(seed, n):
+    """Air distance matrix of n random stops around Munich"""
+    rng = np.random.default_rng(seed)
+    lats = 48.0 + rng.random(n) * 0.5
+    lons = 11.3 + rng.random(n) * 0.7
+    return haversine_matrix(lats, lons)
+
+
+def path_length(route, dist):
+    """Length of the open path visiting the stops in route order"""
+    return float(dist[route[:-1], route[1:]].sum())
+
+
+def best_two_opt_delta(route, dist):
+    """Smallest length change of any single 2-opt move that keeps both ends of the path in place"""
+    best = 0.0
+    for i in range(1, len(route) - 1):
+        for j in range(i + 2, len(route)):
+            a, b, c, d = route[i - 1], route[i], route[j - 1], route[j]
+            best = min(best, (dist[a, c] + dist[b, d]) - (dist[a, b] + dist[c, d]))
+    return best
+
+
+@pytest.fixture(scope='module')
+def python_kernels():
+    """A copy of route_optimizer imported while numba is unavailable, so its kernels run as plain Python"""
+    saved = sys.modules.get('numba')
+    sys.modules['numba'] = None
+    try:
+        spec = importlib.util.spec_from_file_location('route_optimizer_without_numba', route_optimizer.__file__)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        if saved is None:
+            del sys.modules['numba']
+        else:
+            sys.modules['numba'] = saved
+    assert not module.NUMBA_AVAILABLE
+    return module
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_two_opt_keeps_ends_and_never_lengthens(seed):
+    """2-opt returns a permutation with the same first and last stop and a path no longer than its input"""
+    dist = random_distances(seed, 30)
+    start = np.random.default_rng(seed).permutation(30).astype(np.int64)
+
+    route, moves = route_optimizer._two_opt(start.copy(), dist, 10000)
+
+    assert sorted(route.tolist()) == list(range(30))
+    assert route[0] == start[0] and route[-1] == start[-1]
+    assert path_length(route, dist) <= path_length(start, dist) + 1e-9
+    assert (moves > 0) == (route.tolist() != start.tolist())
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_two_opt_is_locally_optimal(seed):
+    """Once the don't-look bits settle, no single 2-opt move shortens the path any further"""
+    dist = random_distances(seed, 40)
+    start = route_optimizer._nearest_neighbor(dist, 0)
+
+    route, _ = route_optimizer._two_opt(start.copy(), dist, 10000)
+
+    assert best_two_opt_delta(route, dist) >= -1e-9
+
+
+def test_two_opt_honours_move_limit():
+    """max_moves caps the moves applied"""
+    dist = random_distances(0, 40)
+    route, moves = route_optimizer._two_opt(np.arange(40, dtype=np.int64), dist, 3)
+
+    assert moves == 3
+    assert sorted(route.tolist()) == list(range(40))
+
+
+def test_nearest_neighbor_visits_every_stop_once():
+    """The greedy path starts at the requested stop and always moves to the closest unvisited one"""
+    dist = random_distances(1, 25)
+    route = route_optimizer._nearest_neighbor(dist, 4)
+
+    assert route[0] == 4
+    assert sorted(route.tolist()) == list(range(25))
+    for k in range(1, 25):
+        unvisited = [stop for stop in range(25) if stop not in route[:k]]
+        assert dist[route[k - 1], route[k]] == min(dist[route[k - 1], stop] for stop in unvisited)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_python_kernels_match_compiled(python_kernels, seed):
+    """Without numba the same kernels run as plain Python and produce the same paths"""
+    dist = random_distances(seed, 30)
+
+    assert (python_kernels._nearest_neighbor(dist, 0).tolist()
+            == route_optimizer._nearest_neighbor(dist, 0).tolist())
+
+    start = np.random.default_rng(seed).permutation(30).astype(np.int64)
+    python_route, python_moves = python_kernels._two_opt(start.copy(), dist, 10000)
+    compiled_route, compiled_moves = route_optimizer._two_opt(start.copy(), dist, 10000)
+
+    assert python_route.tolist() == compiled_route.tolist()
+    assert python_moves == compiled_moves